@@ -0,0 +1,298 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import abort, current_app, render_template, request, session
+from flask_login import current_user
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import defer
+from werkzeug.exceptions import HTTPException
+
+from compression import CompressionMiddleware
+from database import REPLICA_PREFIX, async_engine_options, async_url, pick_replica, track_engine
+from extensions import compressed_cache, count_cache, login_manager, sql_instrumentation, user_cache
+from main import create_app, author_loading, blog_posts_response, page_size, render_post
+from streaming import stream_page
+from models import Posts, Users
+from pagination import decode_cursor, keyset_paginate_async
+
+# ASGI ENTRY POINT
+#   uvicorn --factory asgi:create_asgi_app
+#
+# * The read-heavy pages (blog listing, single posts, user list) run as
+#   coroutines on the event loop and query through an async engine (aiosqlite,
+#   aiomysql) on the same database, so a request waiting on the database holds
+#   no thread. Sessions, login, templates, flashed messages, conditional GET,
+#   read replicas and the after_request hooks are the Flask app's own.
+# * Everything else runs through the Flask WSGI app on a pool of ASGI_THREADS
+#   threads. Request bodies are buffered in memory.
+#
+# Response bodies go out a chunk at a time as the WSGI iterable yields them, so
+# STREAM_LISTINGS and streamed compression work on both paths. A WSGI body is
+# iterated on the one executor thread that started it, which waits for each
+# send: a streamed page keeps its request context, and a slow client holds
+# back the thread rather than piling chunks up in memory.
+#
+# The sampling profiler only sees the WSGI requests. Compression applies to both.
+
+
+def _environ(scope, body):
+    # a WSGI environ for an ASGI http scope
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else 'HTTP_' + name
+        value = value.decode('latin-1')
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def _start_message(status, headers):
+    return {'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]}
+
+
+def _call_wsgi(wsgi_app, environ):
+    # runs a WSGI app, yielding ASGI messages as its body is produced. The head
+    # waits for the first non-empty chunk, so errors until then still change it.
+    started = []
+    written = []
+    sent = [False]
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and sent[0]:
+            raise exc_info[1].with_traceback(exc_info[2])
+        started[:] = [status, headers]
+        return written.append
+
+    iterable = wsgi_app(environ, start_response)
+    remaining = None
+    try:
+        for chunk in iterable:
+            if written:
+                chunk = b''.join(written) + chunk
+                written.clear()
+            if not chunk:
+                continue
+            if not sent[0]:
+                sent[0] = True
+                yield _start_message(*started)
+                length = next((v for k, v in started[1] if k.lower() == 'content-length'), None)
+                if length is not None:
+                    remaining = int(length)
+            if remaining is not None:
+                remaining -= len(chunk)
+            # with a Content-Length the last chunk closes the body, otherwise
+            # an empty message does
+            yield {'type': 'http.response.body', 'body': chunk,
+                   'more_body': remaining is None or remaining > 0}
+            if remaining is not None and remaining <= 0:
+                return
+        if not sent[0]:
+            yield _start_message(*started)
+        yield {'type': 'http.response.body', 'body': b''.join(written)}
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+
+def _send_wsgi(wsgi_app, environ, send, loop):
+    # in an executor thread, each send waits until the event loop has sent it
+    for message in _call_wsgi(wsgi_app, environ):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+
+def _flask_response(environ, start_response):
+    # the response an async view already built, sent through the WSGI middleware
+    return environ['flask.response'](environ, start_response)
+
+
+# ASYNC VIEWS
+# Same pages as their WSGI views in main.py, async_view(db_session, **view_args).
+
+async def blog_posts(db_session):
+    per_page = page_size('POSTS_PER_PAGE', 'POSTS_MAX_PER_PAGE')
+    newest_first = request.args.get('order') == 'newest'
+    stmt = select(Posts).options(defer(Posts.content), author_loading())
+    author = None
+    user_id = request.args.get('user_id', type=int)
+    if user_id is not None:
+        author = await db_session.get(Users, user_id)
+        if author is None:
+            abort(404)
+        stmt = stmt.where(Posts.user_id == user_id)
+    posts = await keyset_paginate_async(db_session, stmt, Posts.date_posted, Posts.id, per_page,
+                                        after=decode_cursor(request.args.get('after')),
+                                        before=decode_cursor(request.args.get('before')),
+                                        newest_first=newest_first)
+    order = 'newest' if newest_first else 'oldest'
+    if current_app.config['STREAM_LISTINGS']:
+        # rows are already fetched, only the rendering streams
+        return stream_page('blog_posts.html', posts=posts, per_page=per_page, order=order, author=author)
+    return blog_posts_response(posts, per_page, order, author)
+
+
+async def post(db_session, id):
+    post = await db_session.get(Posts, id)
+    if post is None:
+        abort(404)
+    return render_post(post)
+
+
+async def users(db_session):
+    per_page = page_size('USERS_PER_PAGE', 'USERS_MAX_PER_PAGE')
+    our_users = await keyset_paginate_async(db_session, select(Users), Users.date_added, Users.id, per_page,
+                                            after=decode_cursor(request.args.get('after')),
+                                            before=decode_cursor(request.args.get('before')))
+    count = count_cache.get('users')
+    if count is None:
+        count = await db_session.scalar(select(func.count(Users.id)))
+        count_cache.set('users', count)
+    context = dict(our_users=our_users, per_page=per_page, user_count=count)
+    if current_app.config['STREAM_LISTINGS']:
+        return stream_page('users.html', **context)
+    return render_template('users.html', **context)
+
+
+ASYNC_VIEWS = {
+    'main.blog_posts': blog_posts,
+    'main.post': post,
+    'main.users': users,
+}
+
+
+class ASGIApp:
+    def __init__(self, app, views=ASYNC_VIEWS):
+        self.app = app
+        self.views = views
+        self.executor = ThreadPoolExecutor(max_workers=app.config['ASGI_THREADS'], thread_name_prefix='wsgi')
+        urls = {None: app.config['ASYNC_DATABASE_URL'] or async_url(app.config['SQLALCHEMY_DATABASE_URI'])}
+        urls.update({key: async_url(url) for key, url in app.config['SQLALCHEMY_BINDS'].items()
+                     if key.startswith(REPLICA_PREFIX)})
+        self.engines = {}
+        for key, url in urls.items():
+            engine = create_async_engine(url, **async_engine_options(app.config, url))
+            track_engine(engine.sync_engine)
+            sql_instrumentation.instrument(engine.sync_engine)
+            self.engines[key] = engine
+        self.sessionmaker = async_sessionmaker(expire_on_commit=False)
+        self.respond = _flask_response
+        if app.config['COMPRESS_ENABLED']:
+            self.respond = CompressionMiddleware(_flask_response,
+                                                 min_size=app.config['COMPRESS_MIN_SIZE'],
+                                                 level=app.config['COMPRESS_LEVEL'],
+                                                 br_level=app.config['COMPRESS_BR_LEVEL'],
+                                                 cache=compressed_cache)
+        self._urls = app.url_map.bind('localhost')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        view = None
+        if scope['method'] in ('GET', 'HEAD'):
+            environ = _environ(scope, b'')
+            try:
+                endpoint, _ = self._urls.match(environ['PATH_INFO'], scope['method'])
+                view = self.views.get(endpoint)
+            except HTTPException:
+                # 404s and slash redirects are Flask's business
+                pass
+        if view is not None:
+            await self._call_async(view, environ)
+            for message in _call_wsgi(self.respond, environ):
+                await send(message)
+        else:
+            environ = _environ(scope, await _read_body(receive))
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, _send_wsgi, self.app, environ, send, loop)
+
+    async def _call_async(self, view, environ):
+        # Flask's full_dispatch_request with an awaited view in the middle
+        app = self.app
+        with app.request_context(environ):
+            try:
+                try:
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await self._dispatch(view)
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+            except Exception as e:
+                response = app.handle_exception(e)
+        environ['flask.response'] = response
+
+    async def _dispatch(self, view):
+        async with self.sessionmaker(bind=self.engines[pick_replica()]) as db_session:
+            # login_required. A user missing from user_cache is loaded here, so
+            # flask-login's own loader finds it without a blocking query.
+            user_id = session.get('_user_id')
+            if user_id is not None and user_cache.get(int(user_id)) is None:
+                user = await db_session.get(Users, int(user_id))
+                if user is not None:
+                    db_session.expunge(user)
+                    user_cache.set(user.id, user)
+            if not current_user.is_authenticated:
+                return login_manager.unauthorized()
+            return await view(db_session, **request.view_args)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for engine in self.engines.values():
+                    await engine.dispose()
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app(config=None):
+    return ASGIApp(create_app(config))
@@ -0,0 +1,171 @@
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import posixpath
+from flask import current_app, request, send_from_directory, url_for
+from markupsafe import Markup, escape
+
+try:
+    import brotli
+except ImportError:  # .br files are skipped without it
+    brotli = None
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # image derivatives are skipped without Pillow
+    Image = ImageOps = None
+
+# STATIC ASSET PIPELINE
+# `flask --app main assets build` copies everything under static/ into
+# static/dist/ with a content hash in the filename. Text assets also get .gz
+# and .br neighbours, and JPEG/PNG images get resized WebP and JPEG copies.
+# Everything is recorded in static/dist/manifest.json.
+#
+# With a manifest present, url_for('static', filename='css/style.css') points
+# at the hashed copy. Hashed files never change, so they are sent with a year
+# long immutable Cache-Control, precompressed when the client accepts it.
+# Without a manifest everything is served straight from static/ as before.
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.txt', '.json', '.html', '.xml', '.map'}
+RESIZABLE = {'.jpg', '.jpeg', '.png'}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _hashed_name(path, data):
+    root, ext = posixpath.splitext(path)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def _write(out_dir, name, data):
+    path = os.path.join(out_dir, name)
+    # same name means same content, so earlier builds are reused as they are
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+def _derivatives(data, widths, out_dir, name):
+    # resized WebP / JPEG copies, never wider than the original
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    root = posixpath.splitext(name)[0]
+    sizes = []
+    for width in sorted(set(w for w in widths if w < image.width)) + [image.width]:
+        resized = image if width == image.width else image.resize(
+            (width, round(image.height * width / image.width)), Image.LANCZOS)
+        entry = {'width': width}
+        for fmt, ext, options in (('WEBP', '.webp', {'quality': 80, 'method': 6}),
+                                  ('JPEG', '.jpg', {'quality': 82, 'optimize': True, 'progressive': True})):
+            buffer = io.BytesIO()
+            resized.save(buffer, fmt, **options)
+            variant = _hashed_name(f'{root}-{width}w{ext}', buffer.getvalue())
+            _write(out_dir, variant, buffer.getvalue())
+            entry[ext[1:]] = variant
+        sizes.append(entry)
+    return sizes
+
+
+def build_assets(static_folder, prefix='dist', image_widths=(320, 640, 1024, 1600)):
+    # returns the manifest it wrote
+    out_dir = os.path.join(static_folder, prefix)
+    manifest = {'files': {}, 'encodings': {}, 'images': {}}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and os.path.join(root, d) != out_dir)
+        for filename in sorted(files):
+            if filename.startswith('.'):
+                continue
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+            hashed = _hashed_name(name, data)
+            _write(out_dir, hashed, data)
+            manifest['files'][name] = hashed
+
+            ext = posixpath.splitext(name)[1].lower()
+            if ext in COMPRESSIBLE:
+                encodings = []
+                if brotli is not None:
+                    compressed = brotli.compress(data, quality=11)
+                    if len(compressed) < len(data):
+                        _write(out_dir, hashed + '.br', compressed)
+                        encodings.append('br')
+                compressed = gzip.compress(data, compresslevel=9, mtime=0)
+                if len(compressed) < len(data):
+                    _write(out_dir, hashed + '.gz', compressed)
+                    encodings.append('gzip')
+                if encodings:
+                    manifest['encodings'][hashed] = encodings
+            elif ext in RESIZABLE and Image is not None:
+                manifest['images'][name] = _derivatives(data, image_widths, out_dir, hashed)
+
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+class AssetPipeline:
+    def __init__(self):
+        self.prefix = 'dist'
+        self.manifest = {'files': {}, 'encodings': {}, 'images': {}}
+
+    def init_app(self, app):
+        self.prefix = app.config['ASSETS_PREFIX']
+        self.load(app.static_folder)
+        app.url_defaults(self._hashed_url)
+        app.view_functions['static'] = self.send_static
+        app.add_template_global(self.picture)
+
+    def load(self, static_folder):
+        path = os.path.join(static_folder, self.prefix, 'manifest.json')
+        try:
+            with open(path) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {'files': {}, 'encodings': {}, 'images': {}}
+
+    def _hashed_url(self, endpoint, values):
+        # rewrites url_for('static', filename=...) to the hashed copy
+        if endpoint == 'static':
+            hashed = self.manifest['files'].get(values.get('filename'))
+            if hashed is not None:
+                values['filename'] = f'{self.prefix}/{hashed}'
+
+    def send_static(self, filename):
+        app = current_app
+        if not filename.startswith(self.prefix + '/'):
+            return app.send_static_file(filename)
+        hashed = filename[len(self.prefix) + 1:]
+        directory = os.path.join(app.static_folder, self.prefix)
+        response = None
+        for encoding in self.manifest['encodings'].get(hashed, ()):
+            if request.accept_encodings[encoding]:
+                suffix = '.br' if encoding == 'br' else '.gz'
+                response = send_from_directory(directory, hashed + suffix,
+                                               mimetype=mimetypes.guess_type(hashed)[0])
+                response.headers['Content-Encoding'] = encoding
+                break
+        if response is None:
+            response = send_from_directory(directory, hashed)
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def picture(self, filename, alt='', sizes='100vw', **attrs):
+        # <picture> with WebP and JPEG srcsets when the build made derivatives
+        extra = ''.join(f' {escape(k)}="{escape(v)}"' for k, v in attrs.items())
+        variants = self.manifest['images'].get(filename)
+        if not variants:
+            return Markup(f'<img src="{escape(url_for("static", filename=filename))}" alt="{escape(alt)}"{extra}/>')
+
+        def srcset(kind):
+            return ', '.join(f'{url_for("static", filename=self.prefix + "/" + v[kind])} {v["width"]}w'
+                             for v in variants)
+        largest = url_for('static', filename=f'{self.prefix}/{variants[-1]["jpg"]}')
+        return Markup(f'<picture><source type="image/webp" srcset="{escape(srcset("webp"))}" sizes="{escape(sizes)}">'
+                      f'<img src="{escape(largest)}" srcset="{escape(srcset("jpg"))}" sizes="{escape(sizes)}" '
+                      f'alt="{escape(alt)}"{extra}/></picture>')
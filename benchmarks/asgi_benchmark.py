@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from main import create_app  # noqa: E402
+from extensions import db  # noqa: E402
+from routes_benchmark import PASSWORD, percentile, seed  # noqa: E402
+
+# ASGI VS WSGI BENCHMARK
+# Serves one seeded SQLite database twice: through werkzeug's threaded server
+# (what app.run uses) and through uvicorn with asgi.py. The read pages are then
+# driven over N concurrent keep-alive connections at each concurrency level.
+#
+# SQLite answers in microseconds, so on its own this mostly measures framework
+# overhead. --db-latency-ms adds a wait to every query, standing in for a
+# database across the network. That is where a thread per request runs out
+# and the async pages should pull ahead.
+#
+#   python benchmarks/asgi_benchmark.py --posts 10000 --concurrency 1,10,50,200 --db-latency-ms 2
+#
+# Needs uvicorn and aiosqlite installed.
+
+ROUTES = ('blog_posts', 'post', 'users')
+SERVER_CONFIG = {'SECRET_KEY': 'benchmark', 'WTF_CSRF_ENABLED': False, 'RATELIMIT_ENABLED': False,
+                 'TASK_WORKERS': 0, 'HASH_WORKERS': 0, 'SQL_SERVER_TIMING': False}
+
+
+# SERVER SIDE, run in a subprocess per mode
+def add_latency(app, asgi_app, seconds):
+    # sync engines sleep their thread, async engines await inside the greenlet
+    # their driver runs in, so neither blocks more than a real round trip would
+    from sqlalchemy.util import await_only
+
+    def blocking(*args):
+        time.sleep(seconds)
+
+    def nonblocking(*args):
+        await_only(asyncio.sleep(seconds))
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', blocking)
+    if asgi_app is not None:
+        for engine in asgi_app.engines.values():
+            event.listen(engine.sync_engine, 'before_cursor_execute', nonblocking)
+
+
+def serve(mode, database, port, latency_ms):
+    config = dict(SERVER_CONFIG, SQLALCHEMY_DATABASE_URI=f'sqlite:///{database}')
+    if mode == 'asgi':
+        import uvicorn
+        from asgi import create_asgi_app
+        application = create_asgi_app(config)
+        if latency_ms:
+            add_latency(application.app, application, latency_ms / 1000)
+        uvicorn.run(application, host='127.0.0.1', port=port, log_level='warning', access_log=False)
+    else:
+        from werkzeug.serving import run_simple
+        app = create_app(config)
+        if latency_ms:
+            add_latency(app, None, latency_ms / 1000)
+        run_simple('127.0.0.1', port, app, threaded=True)
+
+
+# CLIENT SIDE
+class Connection:
+    # a minimal HTTP/1.1 keep-alive client, reconnects when the server closes
+    def __init__(self, port, cookie=''):
+        self.port = port
+        self.cookie = cookie
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b'', content_type=None):
+        for attempt in range(2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+            head = [f'{method} {path} HTTP/1.1', f'Host: 127.0.0.1:{self.port}', 'Accept-Encoding: identity',
+                    f'Content-Length: {len(body)}']
+            if self.cookie:
+                head.append(f'Cookie: {self.cookie}')
+            if content_type:
+                head.append(f'Content-Type: {content_type}')
+            self.writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+            try:
+                await self.writer.drain()
+                return await self._response()
+            except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+                await self.close()
+                if attempt:
+                    raise
+        return None
+
+    async def _response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('server closed the connection')
+        status = int(status_line.split()[1])
+        headers = []
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            headers.append((name.strip().lower(), value.strip()))
+        fields = dict(headers)
+        if 'content-length' in fields:
+            body = await self.reader.readexactly(int(fields['content-length']))
+        elif fields.get('transfer-encoding') == 'chunked':
+            body = b''
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+                body += chunk[:-2]
+        else:
+            body = await self.reader.read()
+            await self.close()
+        for name, value in headers:
+            if name == 'set-cookie' and value.startswith('session='):
+                self.cookie = value.split(';', 1)[0]
+        if fields.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, body
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+        self.reader = self.writer = None
+
+
+async def login(port):
+    connection = Connection(port)
+    form = urlencode({'username': 'user1', 'password': PASSWORD}).encode()
+    status, _ = await connection.request('POST', '/login/', form, 'application/x-www-form-urlencoded')
+    assert status == 302, f'login failed ({status})'
+    # picks up the flashed login message so the cookie is clean for the run
+    await connection.request('GET', '/blog-posts/')
+    await connection.close()
+    return connection.cookie
+
+
+async def drive(port, cookie, route, n_posts, concurrency, requests, rng):
+    def path():
+        if route == 'post':
+            return f'/blog-posts/{rng.randrange(1, n_posts + 1)}/'
+        return {'blog_posts': '/blog-posts/', 'users': '/users/'}[route]
+
+    remaining = [requests]
+    timings = []
+    statuses = {}
+
+    async def worker():
+        connection = Connection(port, cookie)
+        try:
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                t0 = time.perf_counter()
+                status, _ = await connection.request('GET', path())
+                timings.append(time.perf_counter() - t0)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            await connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'throughput_rps': round(len(timings) / elapsed, 2),
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 99) * 1000, 3),
+        'status_codes': {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+def run_mode(mode, database, args, concurrency, routes):
+    port = free_port()
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', mode, '--database', database,
+                                '--port', str(port), '--db-latency-ms', str(args.db_latency_ms)],
+                               start_new_session=True)
+    try:
+        wait_for(port, process)
+        cookie = asyncio.run(login(port))
+        results = {}
+        for route in routes:
+            results[route] = {}
+            for level in concurrency:
+                rng = random.Random(7)
+                asyncio.run(drive(port, cookie, route, args.posts, level, args.warmup, rng))
+                results[route][str(level)] = asyncio.run(drive(port, cookie, route, args.posts, level,
+                                                               args.requests, rng))
+        return results
+    finally:
+        # the whole process group, so no child is left holding the port
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+        except ProcessLookupError:
+            pass
+
+
+def print_table(results, concurrency, routes):
+    print(f'\n{"route":<12} {"conns":>6} {"wsgi req/s":>11} {"asgi req/s":>11} {"wsgi p95":>9} {"asgi p95":>9}')
+    for route in routes:
+        for level in concurrency:
+            wsgi, asgi_ = results['wsgi'][route][str(level)], results['asgi'][route][str(level)]
+            print(f'{route:<12} {level:>6} {wsgi["throughput_rps"]:>11} {asgi_["throughput_rps"]:>11} '
+                  f'{wsgi["p95_ms"]:>9} {asgi_["p95_ms"]:>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ASGI vs WSGI benchmark')
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--concurrency', default='1,10,50,200', help='comma separated connection counts')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per route and concurrency level')
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--routes', default=','.join(ROUTES))
+    parser.add_argument('--db-latency-ms', type=float, default=0, help='added to every query')
+    parser.add_argument('--out', default='asgi_benchmark_results.json')
+    parser.add_argument('--serve', choices=('wsgi', 'asgi'), help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.database, args.port, args.db_latency_ms)
+        return
+
+    concurrency = [int(c) for c in args.concurrency.split(',') if c.strip()]
+    routes = [r.strip() for r in args.routes.split(',') if r.strip()]
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'bench.db')
+        app = create_app(dict(SERVER_CONFIG, SQLALCHEMY_DATABASE_URI=f'sqlite:///{database}'))
+        with app.app_context():
+            db.create_all()
+            seed(args.posts, args.users)
+            db.session.commit()
+            db.engine.dispose()
+        results = {
+            'meta': {'date': datetime.utcnow().isoformat(), 'python': platform.python_version(),
+                     'platform': platform.platform(), 'posts': args.posts, 'users': args.users,
+                     'requests': args.requests, 'db_latency_ms': args.db_latency_ms},
+            'wsgi': run_mode('wsgi', database, args, concurrency, routes),
+            'asgi': run_mode('asgi', database, args, concurrency, routes),
+        }
+    print_table(results, concurrency, routes)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'\nresults written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import importlib.util
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import create_engine
+
+# INDEX BENCHMARK
+# Seeds a SQLite database shaped like the app's tables, prints the query plan and
+# timing of the hot queries, applies the index migration, prints them again, then
+# runs the downgrade to prove it is reversible.
+#
+#   python benchmarks/index_benchmark.py --posts 200000 --users 20000
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MIGRATION = os.path.join(HERE, '..', 'migrations', 'versions', 'ec246b8151e4_add_posts_and_users_indexes.py')
+
+SCHEMA = """
+CREATE TABLE users (
+    id INTEGER NOT NULL PRIMARY KEY,
+    username VARCHAR(20) NOT NULL UNIQUE,
+    name VARCHAR(120) NOT NULL,
+    email VARCHAR(120) NOT NULL UNIQUE,
+    favorite_color VARCHAR(120),
+    date_added DATETIME,
+    password_hash VARCHAR(128)
+);
+CREATE TABLE posts (
+    id INTEGER NOT NULL PRIMARY KEY,
+    title VARCHAR(255),
+    content TEXT,
+    author VARCHAR(255),
+    date_posted DATETIME,
+    slug VARCHAR(255)
+);
+"""
+
+# (label, sql, params) - params are filled in once the data is seeded
+QUERIES = [
+    ('blog_posts first page', 'SELECT * FROM posts ORDER BY date_posted, id LIMIT 21', ()),
+    ('blog_posts deep page', 'SELECT * FROM posts WHERE date_posted > :d OR (date_posted = :d AND id > :id) '
+                             'ORDER BY date_posted, id LIMIT 21', 'deep'),
+    ('post by slug', 'SELECT * FROM posts WHERE slug = :slug', 'slug'),
+    ('posts by author', 'SELECT id FROM posts WHERE author = :author', 'author'),
+    ('sign_up user list', 'SELECT id FROM users ORDER BY date_added LIMIT 50', ()),
+]
+
+
+def seed(path, n_posts, n_users):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    start = datetime(2020, 1, 1)
+    rng = random.Random(42)
+    conn.executemany(
+        'INSERT INTO users (id, username, name, email, favorite_color, date_added, password_hash) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        ((i, f'user{i}', f'User {i}', f'user{i}@example.com', 'Blue',
+          (start + timedelta(seconds=rng.randrange(10 ** 8))).isoformat(' '), 'x') for i in range(1, n_users + 1)))
+    conn.executemany(
+        'INSERT INTO posts (id, title, content, author, date_posted, slug) VALUES (?, ?, ?, ?, ?, ?)',
+        ((i, f'Post {i}', 'lorem ipsum ' * 40, f'User {rng.randrange(1, n_users + 1)}',
+          (start + timedelta(seconds=rng.randrange(10 ** 8))).isoformat(' '), f'post-{i}') for i in range(1, n_posts + 1)))
+    conn.commit()
+    conn.execute('ANALYZE')
+    return conn
+
+
+def query_params(conn, n_posts):
+    deep_date, deep_id = conn.execute(
+        'SELECT date_posted, id FROM posts ORDER BY date_posted, id LIMIT 1 OFFSET ?', (n_posts * 9 // 10,)).fetchone()
+    return {
+        'deep': {'d': deep_date, 'id': deep_id},
+        'slug': {'slug': f'post-{n_posts // 2}'},
+        'author': {'author': 'User 1'},
+    }
+
+
+def run(conn, params, repeat):
+    results = {}
+    for label, sql, key in QUERIES:
+        args = params[key] if key else {}
+        plan = ' | '.join(row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, args))
+        timings = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            conn.execute(sql, args).fetchall()
+            timings.append(time.perf_counter() - t0)
+        timings.sort()
+        results[label] = (plan, timings[len(timings) // 2] * 1000)
+    return results
+
+
+def apply_migration(path, direction):
+    spec = importlib.util.spec_from_file_location('index_migration', MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as connection:
+        with Operations.context(MigrationContext.configure(connection)):
+            getattr(migration, direction)()
+    engine.dispose()
+
+
+def report(title, results):
+    print(f'\n== {title}')
+    for label, (plan, ms) in results.items():
+        print(f'{label:<24} {ms:9.3f} ms  {plan}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index before/after benchmark')
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        print(f'seeding {args.posts} posts and {args.users} users ...')
+        conn = seed(path, args.posts, args.users)
+        params = query_params(conn, args.posts)
+        before = run(conn, params, args.repeat)
+        conn.close()
+
+        apply_migration(path, 'upgrade')
+        conn = sqlite3.connect(path)
+        conn.execute('ANALYZE')
+        after = run(conn, params, args.repeat)
+        conn.close()
+
+        report('before (primary keys only)', before)
+        report('after ec246b8151e4', after)
+        print()
+        for label in before:
+            print(f'{label:<24} {before[label][1] / max(after[label][1], 1e-6):8.1f}x faster')
+
+        apply_migration(path, 'downgrade')
+        conn = sqlite3.connect(path)
+        left = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_%'")]
+        conn.close()
+        print(f'\ndowngrade left indexes: {left or "none"}')
+
+
+if __name__ == '__main__':
+    main()
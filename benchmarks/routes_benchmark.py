@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, insert
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from main import create_app  # noqa: E402
+from extensions import db  # noqa: E402
+from models import Users, Posts, recount_posts  # noqa: E402
+
+# ROUTE BENCHMARK
+# Seeds a SQLite database at one or more sizes, drives every route through the
+# Flask test client and reports throughput, latency percentiles and queries per
+# request. Results are written as JSON and can be compared with a stored
+# baseline from an earlier run.
+#
+#   python benchmarks/routes_benchmark.py --sizes 1000,100000 --users 10000 --out results.json
+#   python benchmarks/routes_benchmark.py --baseline results.json --fail-on-regression
+
+PASSWORD = 'benchmark-password'
+CONTENT = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 20
+
+
+def seed(n_posts, n_users, batch_size=10000):
+    start = datetime(2020, 1, 1)
+    rng = random.Random(42)
+    # every seeded user shares one hash, hashing 10k passwords would dominate the run
+    pwhash = generate_password_hash(PASSWORD)
+
+    rows = []
+    for i in range(1, n_users + 1):
+        rows.append({'id': i, 'username': f'user{i}', 'name': f'User {i}', 'email': f'user{i}@example.com',
+                     'favorite_color': 'Blue', 'date_added': start + timedelta(minutes=i), 'password_hash': pwhash})
+        if len(rows) == batch_size:
+            db.session.execute(insert(Users.__table__), rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(Users.__table__), rows)
+
+    rows = []
+    for i in range(1, n_posts + 1):
+        posted = start + timedelta(seconds=i * 60 + rng.randrange(60))
+        user_id = rng.randrange(1, n_users + 1)
+        rows.append({'id': i, 'title': f'Post number {i}', 'content': CONTENT, 'author': f'User {user_id}',
+                     'user_id': user_id, 'date_posted': posted, 'last_modified': posted, 'slug': f'post-{i}'})
+        if len(rows) == batch_size:
+            db.session.execute(insert(Posts.__table__), rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(Posts.__table__), rows)
+    recount_posts()
+    db.session.commit()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def login(client, username='user1'):
+    response = client.post('/login/', data={'username': username, 'password': PASSWORD})
+    assert response.status_code == 302, f'login failed ({response.status_code})'
+
+
+def scenarios(n_posts, n_users, rng, state):
+    # route name -> (needs login, function(client, i) returning a response)
+    def blog_posts(client, i):
+        return client.get('/blog-posts/')
+
+    def blog_posts_newest(client, i):
+        return client.get('/blog-posts/?order=newest')
+
+    def post(client, i):
+        return client.get(f'/blog-posts/{rng.randrange(1, n_posts + 1)}/')
+
+    def add_post(client, i):
+        response = client.post('/add-post/', data={'title': f'Bench {i}', 'content': CONTENT,
+                                                   'author': 'User 1', 'slug': f'bench-{state["run"]}-{i}'})
+        state['added'].append(f'bench-{state["run"]}-{i}')
+        return response
+
+    def edit_post(client, i):
+        id = rng.randrange(1, n_posts + 1)
+        # the form's row version, only this scenario edits the seeded posts
+        version = state['versions'].get(id, 1)
+        response = client.post(f'/blog-posts/edit/{id}/', data={'title': f'Edited {i}', 'content': CONTENT,
+                                                                 'author': 'User 1', 'slug': f'post-{id}',
+                                                                 'version': version, 'old_slug': f'post-{id}'})
+        if response.status_code == 302:
+            state['versions'][id] = version + 1
+        return response
+
+    def delete_post(client, i):
+        if not state['delete_ids']:
+            with state['app'].app_context():
+                slugs = state['added']
+                state['delete_ids'] = [id for (id,) in db.session.query(Posts.id).filter(Posts.slug.in_(slugs))]
+        return client.get(f'/blog-post/delete/{state["delete_ids"].pop()}/')
+
+    def dashboard(client, i):
+        return client.get('/dashboard/')
+
+    def sign_up_get(client, i):
+        return client.get('/sign-up/')
+
+    def sign_up_post(client, i):
+        name = f'b{state["run"]}x{i}'
+        return client.post('/sign-up/', data={'name': name, 'username': name, 'email': f'{name}@example.com',
+                                              'favorite_color': 'red', 'password_hash': 'pw', 'password_hash2': 'pw'})
+
+    def users(client, i):
+        return client.get('/users/')
+
+    def login_route(client, i):
+        return client.post('/login/', data={'username': f'user{rng.randrange(1, n_users + 1)}', 'password': PASSWORD})
+
+    return {
+        'login': (False, login_route),
+        'dashboard': (True, dashboard),
+        'sign_up GET': (False, sign_up_get),
+        'sign_up POST': (False, sign_up_post),
+        'users': (True, users),
+        'blog_posts': (True, blog_posts),
+        'blog_posts newest': (True, blog_posts_newest),
+        'post': (True, post),
+        'add_post': (True, add_post),
+        'edit_post': (True, edit_post),
+        'delete_post': (True, delete_post),
+    }
+
+
+def run_size(n_posts, n_users, requests, warmup, only, config):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(dict(config, SQLALCHEMY_DATABASE_URI=f'sqlite:///{os.path.join(tmp, "bench.db")}'))
+        with app.app_context():
+            db.create_all()
+            t0 = time.perf_counter()
+            seed(n_posts, n_users)
+            seeded_in = time.perf_counter() - t0
+            counter = QueryCounter()
+            event.listen(db.engine, 'before_cursor_execute', counter)
+
+        rng = random.Random(7)
+        state = {'app': app, 'run': int(time.time()), 'added': [], 'delete_ids': [], 'versions': {}}
+        results = {}
+        for name, (needs_login, fn) in scenarios(n_posts, n_users, rng, state).items():
+            if only and name not in only:
+                continue
+            if name == 'delete_post' and not state['added']:
+                # delete needs rows to delete, make them first
+                _, add = scenarios(n_posts, n_users, rng, state)['add_post']
+                client = app.test_client()
+                login(client)
+                for i in range(requests + warmup):
+                    add(client, -i - 1)
+            client = app.test_client()
+            if needs_login:
+                login(client)
+            for i in range(warmup):
+                fn(client, -i - 1 - requests - warmup)
+
+            timings = []
+            statuses = {}
+            counter.count = 0
+            started = time.perf_counter()
+            for i in range(requests):
+                t0 = time.perf_counter()
+                response = fn(client, i)
+                timings.append(time.perf_counter() - t0)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            elapsed = time.perf_counter() - started
+            timings.sort()
+            results[name] = {
+                'requests': requests,
+                'throughput_rps': round(requests / elapsed, 2),
+                'p50_ms': round(percentile(timings, 50) * 1000, 3),
+                'p95_ms': round(percentile(timings, 95) * 1000, 3),
+                'p99_ms': round(percentile(timings, 99) * 1000, 3),
+                'max_ms': round(timings[-1] * 1000, 3),
+                'queries_per_request': round(counter.count / requests, 2),
+                'status_codes': {str(k): v for k, v in sorted(statuses.items())},
+            }
+        with app.app_context():
+            db.engine.dispose()
+        return {'posts': n_posts, 'users': n_users, 'seed_seconds': round(seeded_in, 2), 'routes': results}
+
+
+def compare(current, baseline, tolerance):
+    # returns a list of (size, route, metric, baseline, current, change) for regressions
+    regressions = []
+    for size, data in current['sizes'].items():
+        old_routes = baseline.get('sizes', {}).get(size, {}).get('routes', {})
+        print(f'\n== {size} vs baseline')
+        for route, stats in data['routes'].items():
+            old = old_routes.get(route)
+            if not old:
+                continue
+            line = []
+            for metric, higher_is_worse in (('p50_ms', True), ('p95_ms', True), ('throughput_rps', False),
+                                            ('queries_per_request', True)):
+                before, after = old[metric], stats[metric]
+                change = (after - before) / before if before else 0.0
+                line.append(f'{metric} {change:+.1%}')
+                worse = change > tolerance if higher_is_worse else change < -tolerance
+                if worse:
+                    regressions.append((size, route, metric, before, after, change))
+            print(f'{route:<20} ' + '  '.join(line))
+    return regressions
+
+
+def print_table(size, data):
+    print(f'\n== {size}: {data["posts"]} posts, {data["users"]} users (seeded in {data["seed_seconds"]}s)')
+    print(f'{"route":<20} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"queries":>8}  status')
+    for route, s in data['routes'].items():
+        print(f'{route:<20} {s["throughput_rps"]:>9} {s["p50_ms"]:>9} {s["p95_ms"]:>9} {s["p99_ms"]:>9} '
+              f'{s["queries_per_request"]:>8}  {s["status_codes"]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Route benchmark')
+    parser.add_argument('--sizes', default='1000,100000', help='comma separated post counts, e.g. 1000,100000,1000000')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per route')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--routes', default='', help='comma separated subset of routes to run')
+    parser.add_argument('--hash-workers', type=int, default=None, help='HASH_WORKERS for the app, 0 hashes inline')
+    parser.add_argument('--out', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed slowdown before flagging, 0.10 = 10%%')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    # every request comes from one address, the login limits would reject most of them
+    config = {'SECRET_KEY': 'benchmark', 'WTF_CSRF_ENABLED': False, 'HASH_WORKERS': args.hash_workers,
+              'RATELIMIT_ENABLED': False}
+    only = {r.strip() for r in args.routes.split(',') if r.strip()}
+    results = {
+        'meta': {'date': datetime.utcnow().isoformat(), 'python': platform.python_version(),
+                 'platform': platform.platform(), 'requests': args.requests, 'warmup': args.warmup},
+        'sizes': {},
+    }
+    for size in (int(s) for s in args.sizes.split(',')):
+        label = f'{size}_posts'
+        results['sizes'][label] = run_size(size, args.users, args.requests, args.warmup, only, config)
+        print_table(label, results['sizes'][label])
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f'\nresults written to {args.out}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for size, route, metric, before, after, change in regressions:
+            print(f'REGRESSION {size} {route} {metric}: {before} -> {after} ({change:+.1%})')
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+
+# IN-PROCESS CACHES
+# A small LRU cache bounded by entry count and by total size, with an
+# optional time to live. Each worker process has its own, so writers must
+# invalidate explicitly; the TTL bounds how stale another worker can be.
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, max_items=1024, max_bytes=None, sizeof=len, ttl=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.bytes = 0
+        self._data = OrderedDict()  # key -> (value, size, expires at)
+        self._lock = threading.Lock()
+
+    def configure(self, max_items=None, max_bytes=None, ttl=None):
+        # used by create_app() to apply the limits from config
+        with self._lock:
+            if max_items is not None:
+                self.max_items = max_items
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            if ttl is not None:
+                self.ttl = ttl
+            self._data.clear()
+            self.bytes = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            if entry[2] is not None and entry[2] <= time.monotonic():
+                del self._data[key]
+                self.bytes -= entry[1]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = self.sizeof(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            # never cache something bigger than the whole cache
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._data[key] = (value, size, expires)
+            self.bytes += size
+            while len(self._data) > self.max_items or (self.max_bytes and self.bytes > self.max_bytes):
+                _, evicted = self._data.popitem(last=False)
+                self.bytes -= evicted[1]
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+
+    def delete_where(self, predicate):
+        # drop every entry whose key matches, e.g. all versions of one post
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                self.bytes -= self._data.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'items': len(self._data),
+            'max_items': self.max_items,
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'ttl': self.ttl,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+        }
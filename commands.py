@@ -0,0 +1,308 @@
+import csv
+import json
+import os
+import sys
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.exc import StatementError
+
+from assets import build_assets
+from extensions import db, password_hasher
+from models import Users, Posts, summarize, recount_posts
+
+# BULK IMPORT / EXPORT
+# flask --app main data export-posts posts.jsonl
+# flask --app main data import-posts posts.csv --batch-size 2000
+#
+# Files are streamed a row at a time and written to the database in batched
+# multi-row inserts, so memory use does not grow with the file. The format
+# comes from the file extension (.jsonl or .csv) unless --format is given;
+# "-" reads stdin / writes stdout.
+
+data_cli = AppGroup('data', help='Bulk import and export of posts and users.')
+
+POST_FIELDS = ['id', 'title', 'content', 'author', 'slug', 'date_posted', 'last_modified', 'user_id']
+USER_FIELDS = ['id', 'username', 'name', 'email', 'favorite_color', 'date_added']
+INT_FIELDS = {'id', 'user_id'}
+DATE_FIELDS = {'date_posted', 'last_modified', 'date_added'}
+
+
+def _format(path, fmt):
+    if fmt:
+        return fmt
+    if path.endswith('.csv'):
+        return 'csv'
+    if path.endswith(('.jsonl', '.ndjson', '.json')) or path == '-':
+        return 'jsonl'
+    raise click.BadParameter(f'cannot tell the format of {path}, pass --format')
+
+
+def _open(path, mode):
+    if path == '-':
+        return nullcontext(sys.stdin if 'r' in mode else sys.stdout)
+    return open(path, mode, newline='', encoding='utf-8')
+
+
+def _read_rows(f, fmt):
+    if fmt == 'csv':
+        for row in csv.DictReader(f):
+            yield {k: (v if v != '' else None) for k, v in row.items()}
+    else:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class _Writer:
+    def __init__(self, f, fmt, fields):
+        self.f = f
+        self.fmt = fmt
+        self.fields = fields
+        if fmt == 'csv':
+            self.csv = csv.DictWriter(f, fieldnames=fields)
+            self.csv.writeheader()
+
+    def write(self, row):
+        if self.fmt == 'csv':
+            self.csv.writerow(row)
+        else:
+            self.f.write(json.dumps(row, ensure_ascii=False))
+            self.f.write('\n')
+
+
+class _Progress:
+    def __init__(self, label, every=10000):
+        self.label = label
+        self.every = every
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    def add(self, n=1):
+        before = self.rows
+        self.rows += n
+        if self.rows // self.every != before // self.every:
+            self.report()
+
+    def report(self, done=False):
+        elapsed = time.perf_counter() - self.started
+        rate = self.rows / elapsed if elapsed else 0
+        click.echo(f'{self.label}: {self.rows} rows in {elapsed:.1f}s ({rate:,.0f} rows/s){" done" if done else ""}',
+                   err=True)
+
+
+def _clean(row, fields, keep_ids):
+    # every row gets every field, None when the file leaves it out: a multi-row
+    # insert compiles its column list from the first row of the batch
+    out = {}
+    for field in fields:
+        if field == 'id' and not keep_ids:
+            continue
+        value = row.get(field)
+        if field in DATE_FIELDS and isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        elif field in INT_FIELDS and isinstance(value, str):
+            value = int(value)
+        out[field] = value
+    return out
+
+
+def _serialize(row):
+    return {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in row.items()}
+
+
+def _stream(table, fields, batch_size):
+    # plain rows straight off a server side cursor, batch_size at a time
+    stmt = select(*[table.c[f] for f in fields]).order_by(table.c.id)
+    result = db.session.execute(stmt, execution_options={'yield_per': batch_size})
+    for row in result.mappings():
+        yield row
+
+
+def _flush(table, batch):
+    try:
+        db.session.execute(insert(table), batch)
+        db.session.commit()
+    except StatementError as e:
+        # IntegrityError, and rows the driver cannot bind
+        db.session.rollback()
+        raise click.ClickException(f'batch rejected by the database: {e.orig}')
+
+
+@data_cli.command('import-posts')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']))
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--keep-ids', is_flag=True, help='Insert the id column from the file instead of letting the database pick.')
+def import_posts(path, fmt, batch_size, keep_ids):
+    fmt = _format(path, fmt)
+    progress = _Progress('import-posts')
+    batch = []
+    authors = set()
+    now = datetime.utcnow()
+    with _open(path, 'r') as f:
+        for row in _read_rows(f, fmt):
+            post = _clean(row, POST_FIELDS, keep_ids)
+            post['date_posted'] = post['date_posted'] or now
+            post['last_modified'] = post['last_modified'] or post['date_posted']
+            post['excerpt'], post['word_count'], post['reading_time'] = summarize(post.get('content'))
+            if post.get('user_id') is not None:
+                authors.add(post['user_id'])
+            batch.append(post)
+            if len(batch) >= batch_size:
+                _flush(Posts.__table__, batch)
+                progress.add(len(batch))
+                batch = []
+    if batch:
+        _flush(Posts.__table__, batch)
+        progress.add(len(batch))
+    # bulk inserts bypass the ORM events that keep post_count current
+    if authors:
+        recount_posts(authors)
+        db.session.commit()
+    progress.report(done=True)
+
+
+@data_cli.command('recount-posts')
+def recount_posts_command():
+    # rebuilds every user's post_count from the posts table
+    recount_posts()
+    db.session.commit()
+    click.echo('post counts rebuilt', err=True)
+
+
+@data_cli.command('backfill-excerpts')
+@click.option('--batch-size', default=500, show_default=True)
+@click.option('--all', 'redo', is_flag=True, help='Recompute every post, not only those without an excerpt.')
+def backfill_excerpts(batch_size, redo):
+    # fills excerpt, word_count and reading_time for posts written before
+    # they existed, walking the table by id a batch at a time
+    table = Posts.__table__
+    progress = _Progress('backfill-excerpts')
+    stmt = update(table).where(table.c.id == bindparam('b_id')).values(
+        excerpt=bindparam('b_excerpt'), word_count=bindparam('b_word_count'),
+        reading_time=bindparam('b_reading_time'),
+        # a derived column changing is not an edit, keep the validators stable
+        last_modified=table.c.last_modified)
+    last_id = 0
+    while True:
+        query = select(table.c.id, table.c.content).where(table.c.id > last_id)
+        if not redo:
+            query = query.where(table.c.excerpt.is_(None))
+        rows = db.session.execute(query.order_by(table.c.id).limit(batch_size)).all()
+        if not rows:
+            break
+        batch = []
+        for id, content in rows:
+            excerpt, words, minutes = summarize(content)
+            batch.append({'b_id': id, 'b_excerpt': excerpt, 'b_word_count': words, 'b_reading_time': minutes})
+        db.session.execute(stmt, batch)
+        db.session.commit()
+        last_id = rows[-1][0]
+        progress.add(len(rows))
+    progress.report(done=True)
+
+
+@data_cli.command('import-users')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']))
+@click.option('--batch-size', default=500, show_default=True)
+@click.option('--keep-ids', is_flag=True, help='Insert the id column from the file instead of letting the database pick.')
+def import_users(path, fmt, batch_size, keep_ids):
+    # rows carry either a ready made password_hash or a plain password, plain
+    # passwords are hashed a batch at a time across the hashing pool
+    fmt = _format(path, fmt)
+    progress = _Progress('import-users', every=1000)
+    batch = []
+    plain = []
+    now = datetime.utcnow()
+
+    def flush():
+        if plain:
+            hashes = password_hasher.hash_many(password for _, password in plain)
+            for (user, _), pwhash in zip(plain, hashes):
+                user['password_hash'] = pwhash
+            plain.clear()
+        _flush(Users.__table__, batch)
+        progress.add(len(batch))
+        batch.clear()
+
+    with _open(path, 'r') as f:
+        for row in _read_rows(f, fmt):
+            user = _clean(row, USER_FIELDS, keep_ids)
+            user['date_added'] = user['date_added'] or now
+            user['password_hash'] = row.get('password_hash') or None
+            if not user['password_hash'] and row.get('password'):
+                plain.append((user, row['password']))
+            batch.append(user)
+            if len(batch) >= batch_size:
+                flush()
+    if batch:
+        flush()
+    progress.report(done=True)
+
+
+@data_cli.command('export-posts')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']))
+@click.option('--batch-size', default=1000, show_default=True, help='Rows fetched per round trip.')
+def export_posts(path, fmt, batch_size):
+    fmt = _format(path, fmt)
+    progress = _Progress('export-posts')
+    with _open(path, 'w') as f:
+        writer = _Writer(f, fmt, POST_FIELDS)
+        for row in _stream(Posts.__table__, POST_FIELDS, batch_size):
+            writer.write(_serialize(row))
+            progress.add()
+    progress.report(done=True)
+
+
+@data_cli.command('export-users')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']))
+@click.option('--batch-size', default=1000, show_default=True, help='Rows fetched per round trip.')
+@click.option('--include-hashes', is_flag=True, help='Also export password hashes.')
+def export_users(path, fmt, batch_size, include_hashes):
+    fmt = _format(path, fmt)
+    fields = USER_FIELDS + (['password_hash'] if include_hashes else [])
+    progress = _Progress('export-users')
+    with _open(path, 'w') as f:
+        writer = _Writer(f, fmt, fields)
+        for row in _stream(Users.__table__, fields, batch_size):
+            writer.write(_serialize(row))
+            progress.add()
+    progress.report(done=True)
+
+
+# STATIC ASSETS
+# flask --app main assets build
+assets_cli = AppGroup('assets', help='Build fingerprinted and precompressed static files.')
+
+
+@assets_cli.command('build')
+@click.option('--clean', is_flag=True, help='Delete build output that is no longer in the manifest.')
+def build_assets_command(clean):
+    app = current_app
+    started = time.perf_counter()
+    prefix = app.config['ASSETS_PREFIX']
+    manifest = build_assets(app.static_folder, prefix, app.config['ASSET_IMAGE_WIDTHS'])
+    out_dir = os.path.join(app.static_folder, prefix)
+    if clean:
+        keep = {'manifest.json'}
+        for hashed in manifest['files'].values():
+            keep.update((hashed, hashed + '.gz', hashed + '.br'))
+        for sizes in manifest['images'].values():
+            keep.update(v for size in sizes for k, v in size.items() if k != 'width')
+        for root, dirs, files in os.walk(out_dir):
+            for filename in files:
+                path = os.path.join(root, filename)
+                if os.path.relpath(path, out_dir).replace(os.sep, '/') not in keep:
+                    os.remove(path)
+    click.echo(f'{len(manifest["files"])} files, {len(manifest["images"])} images with derivatives '
+               f'in {time.perf_counter() - started:.1f}s -> {out_dir}', err=True)
@@ -0,0 +1,174 @@
+import hashlib
+import zlib
+from werkzeug.http import parse_accept_header
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import brotli
+except ImportError:  # gzip only without it
+    brotli = None
+
+# RESPONSE COMPRESSION MIDDLEWARE
+# Compresses text responses with brotli or gzip, whichever the client prefers
+# (brotli wins a tie).
+#
+# * Buffered responses under min_size go out as they are.
+# * A buffered response with an ETag is compressed once per (ETag, encoding)
+#   and kept in `cache`. A repeat hit with an unchanged body then costs a
+#   sha1 instead of a compression. The body hash is checked because a page
+#   can carry flashed messages without its ETag changing.
+# * Streamed responses (no Content-Length) are compressed chunk by chunk, and
+#   each chunk is flushed so the client still sees the page arrive early.
+# * Responses that already have a Content-Encoding (precompressed static
+#   files, feeds) are left alone.
+#
+# A compressed response's ETag becomes weak, which is what nginx does as well.
+# werkzeug compares If-None-Match weakly, so conditional GETs keep matching.
+
+COMPRESSIBLE = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                'application/rss+xml', 'application/atom+xml', 'image/svg+xml')
+
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _set_header(headers, name, value):
+    lowered = name.lower()
+    headers[:] = [(k, v) for k, v in headers if k.lower() != lowered]
+    if value is not None:
+        headers.append((name, value))
+
+
+def _add_vary(headers):
+    vary = _header(headers, 'Vary')
+    if vary is None:
+        headers.append(('Vary', 'Accept-Encoding'))
+    elif 'accept-encoding' not in vary.lower():
+        _set_header(headers, 'Vary', f'{vary}, Accept-Encoding')
+
+
+def _weaken(headers):
+    etag = _header(headers, 'ETag')
+    if etag and not etag.startswith('W/'):
+        _set_header(headers, 'ETag', 'W/' + etag)
+    return etag
+
+
+class _Compressor:
+    def __init__(self, encoding, level, br_level):
+        if encoding == 'br':
+            self._c = brotli.Compressor(quality=br_level)
+            self._chunk = lambda data: self._c.process(data) + self._c.flush()
+            self._end = self._c.finish
+        else:
+            self._c = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+            self._chunk = lambda data: self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+            self._end = self._c.flush
+
+    def chunk(self, data):
+        return self._chunk(data)
+
+    def finish(self):
+        return self._end()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size=500, level=6, br_level=5, cache=None):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.br_level = br_level
+        self.cache = cache
+
+    def _choose(self, environ):
+        accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        best = None
+        for encoding in (('br', 'gzip') if brotli is not None else ('gzip',)):
+            quality = accept[encoding]
+            if quality and (best is None or quality > best[1]):
+                best = (encoding, quality)
+        return best and best[0]
+
+    def _compress(self, encoding, body):
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.br_level)
+        return zlib.compress(body, self.level, wbits=31)
+
+    def __call__(self, environ, start_response):
+        encoding = self._choose(environ)
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            if exc_info is not None and captured:
+                raise exc_info[1].with_traceback(exc_info[2])
+            captured[:] = [status, list(headers), exc_info]
+            # nothing in this app writes through the legacy write() callable
+            return None
+
+        app_iter = self.app(environ, capture)
+        status, headers, exc_info = captured
+        content_type = (_header(headers, 'Content-Type') or '').split(';')[0].strip().lower()
+        compressible = content_type.startswith(COMPRESSIBLE)
+        cache_control = (_header(headers, 'Cache-Control') or '').lower()
+
+        if status.startswith('304'):
+            # the client's copy was most likely the compressed one
+            _weaken(headers)
+        if (not status.startswith('200') or not compressible or _header(headers, 'Content-Encoding')
+                or 'no-transform' in cache_control):
+            start_response(status, headers, exc_info)
+            return app_iter
+
+        _add_vary(headers)
+        length = _header(headers, 'Content-Length')
+        if length is None:
+            return self._stream(encoding, status, headers, exc_info, app_iter, start_response)
+
+        try:
+            body = b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        if len(body) < self.min_size:
+            start_response(status, headers, exc_info)
+            return [body]
+
+        etag = _weaken(headers)
+        compressed = None
+        if etag and self.cache is not None:
+            digest = hashlib.sha1(body).digest()
+            cached = self.cache.get((etag, encoding))
+            if cached is not None and cached[0] == digest:
+                compressed = cached[1]
+        if compressed is None:
+            compressed = self._compress(encoding, body)
+            if etag and self.cache is not None:
+                self.cache.set((etag, encoding), (digest, compressed))
+        _set_header(headers, 'Content-Encoding', encoding)
+        _set_header(headers, 'Content-Length', str(len(compressed)))
+        start_response(status, headers, exc_info)
+        return [compressed]
+
+    def _stream(self, encoding, status, headers, exc_info, app_iter, start_response):
+        _weaken(headers)
+        _set_header(headers, 'Content-Encoding', encoding)
+        start_response(status, headers, exc_info)
+        compressor = _Compressor(encoding, self.level, self.br_level)
+
+        def chunks():
+            for data in app_iter:
+                if data:
+                    out = compressor.chunk(data)
+                    if out:
+                        yield out
+            yield compressor.finish()
+
+        return ClosingIterator(chunks(), [app_iter.close] if hasattr(app_iter, 'close') else [])
@@ -0,0 +1,30 @@
+import hashlib
+from flask import current_app, make_response, request, session
+from werkzeug.http import is_resource_modified
+
+# CONDITIONAL GET
+# Views work out their validators from cheap data (ids and modification
+# times) and only call render() when the client's copy is out of date.
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def conditional_response(etag, last_modified, render):
+    # pages show per-user chrome and one-shot flashed messages, so a pending
+    # flash always gets a full response
+    fresh = '_flashes' not in session and not is_resource_modified(
+        request.environ, etag=etag, last_modified=last_modified)
+    if fresh:
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    cache_control = current_app.config['CACHE_CONTROL'].get(request.endpoint)
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    response.vary.add('Cookie')
+    return response
@@ -0,0 +1,193 @@
+import functools
+import os
+import random
+import threading
+import time
+import weakref
+from flask import current_app, g, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+# ENGINE AND CONNECTION POOL SETUP
+
+class TimedQueuePool(QueuePool):
+    # a QueuePool that also records how long checkouts wait for a connection
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+
+def engine_options(config):
+    # SQLALCHEMY_ENGINE_OPTIONS built from the DB_POOL_* settings
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # in-memory SQLite is one connection per thread, there is nothing to pool
+        return {}
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+# drivers for the async engines used by asgi.py
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'mysql': 'aiomysql', 'postgresql': 'asyncpg'}
+
+
+def async_url(url):
+    # the same database through its asyncio driver
+    url = make_url(url)
+    return url.set(drivername=f'{url.get_backend_name()}+{ASYNC_DRIVERS[url.get_backend_name()]}')
+
+
+def async_engine_options(config, url):
+    # the DB_POOL_* settings for create_async_engine(), which brings its own pool class
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        # SQLAlchemy picks the pool for aiosqlite (one connection each, nothing to size)
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__, 'status': pool.status()}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(0, pool.overflow()),
+        })
+    if isinstance(pool, TimedQueuePool):
+        stats.update({
+            'checkouts': pool.checkouts,
+            'timeouts': pool.timeouts,
+            'wait_ms_total': round(pool.wait_total * 1000, 3),
+            'wait_ms_avg': round(pool.wait_total * 1000 / pool.checkouts, 3) if pool.checkouts else None,
+            'wait_ms_max': round(pool.wait_max * 1000, 3),
+        })
+    return stats
+
+
+# READ REPLICAS
+# DB_REPLICA_URLS become the binds replica1, replica2, ... Views decorated with
+# @read_replica send their queries to one replica picked per request. Put it
+# above @login_required so loading the user goes there too. Everything else
+# goes to the primary, and so does anything that writes: a flush or an
+# INSERT/UPDATE/DELETE statement, and every query after it in that request.
+#
+# A client that committed a write is kept on the primary for
+# DB_READ_YOUR_WRITES seconds, so it does not read a replica that has not
+# caught up with its own change yet. The deadline is kept in the Flask session
+# cookie, so it holds whichever worker serves the next request.
+REPLICA_PREFIX = 'replica'
+
+
+def replica_binds(config):
+    # SQLALCHEMY_BINDS entries for the DB_REPLICA_URLS setting
+    return {f'{REPLICA_PREFIX}{i}': url for i, url in enumerate(config['DB_REPLICA_URLS'], 1)}
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or self._flushing or isinstance(clause, UpdateBase) or not has_app_context():
+            return engine
+        key = g.get('replica_bind')
+        # models with a bind key of their own keep it
+        if key is None or engine is not self._db.engines.get(None):
+            return engine
+        return self._db.engines[key]
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _stay_on_primary(db_session, flush_context):
+    db_session.info['wrote'] = True
+    if has_app_context():
+        g.pop('replica_bind', None)
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _bulk_write(orm_execute_state):
+    # session.execute(update(...)) and friends write without a flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _stay_on_primary(orm_execute_state.session, None)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _read_your_writes(db_session):
+    if db_session.info.pop('wrote', False) and has_request_context():
+        session['db_primary_until'] = time.time() + current_app.config['DB_READ_YOUR_WRITES']
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_writes(db_session):
+    db_session.info.pop('wrote', None)
+
+
+def pick_replica():
+    # a replica bind key for this request, None while the client reads its own writes
+    keys = [k for k in current_app.config['SQLALCHEMY_BINDS'] if k.startswith(REPLICA_PREFIX)]
+    if keys and session.get('db_primary_until', 0) < time.time():
+        return random.choice(keys)
+    return None
+
+
+def read_replica(view):
+    # the view only reads, so its queries may go to a replica
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.replica_bind = pick_replica()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# Pre-fork servers (gunicorn --preload etc.) must not share pooled connections
+# with the parent. After a fork the child drops the inherited connections
+# without closing them, so the parent's sockets stay intact.
+_engines = weakref.WeakSet()
+
+
+def track_engine(engine):
+    _engines.add(engine)
+
+
+def dispose_engines():
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=dispose_engines)
@@ -0,0 +1,62 @@
+from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from flask_login import LoginManager
+from database import RoutingSession
+from assets import AssetPipeline
+from caching import LRUCache
+from feeds import FeedCache
+from hashing import PasswordHasher
+from ratelimit import RateLimiter
+from search import SearchIndex
+from slugs import SlugMap
+from instrumentation import QueryInstrumentation
+from tasks import TaskQueue
+
+# Shared extension objects, bound to an app in create_app()
+
+#database, read-only views can be routed to replicas, see database.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+migrate = Migrate()
+
+# Flask Login Stuff
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+
+# Hashed static file names, read from static/dist/manifest.json
+assets = AssetPipeline()
+
+# Password hashing pool
+password_hasher = PasswordHasher()
+
+# Login / sign-up attempts per IP and per username
+rate_limiter = RateLimiter()
+
+# Search index, filled from the posts table on first use
+search_index = SearchIndex()
+
+# Live slug -> post id, filled from the posts table on first use
+slug_map = SlugMap()
+
+# RSS / Atom / sitemap bytes for the most recent posts
+feed_cache = FeedCache()
+
+# Rendered post bodies: post id -> (version, html). The page around the body
+# (navbar, flashed messages) is still rendered on every request.
+post_cache = LRUCache(sizeof=lambda entry: len(entry[1].encode('utf-8')))
+
+# Compressed response bodies: (ETag, encoding) -> (body sha1, bytes)
+compressed_cache = LRUCache(sizeof=lambda entry: len(entry[1]))
+
+# Detached copies of recently seen users, keyed by id. Anything that changes
+# or deletes a user must drop its entry.
+user_cache = LRUCache()
+
+# Row counts shown next to listings, short lived so a COUNT(*) runs at most
+# once per TTL per worker
+count_cache = LRUCache(max_items=64)
+
+# Query counts and timings per request
+sql_instrumentation = QueryInstrumentation()
+
+# Background jobs run after the response, see jobs.py for the task functions
+task_queue = TaskQueue()
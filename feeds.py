@@ -0,0 +1,193 @@
+import gzip
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from xml.sax.saxutils import escape
+
+from flask import current_app, request, url_for
+from werkzeug.http import is_resource_modified
+
+# RSS, ATOM AND SITEMAP
+# The three documents are kept in memory as ready-to-send bytes plus a gzip
+# copy, built from a window of the most recent posts. Every post in the window
+# has its <item>/<entry>/<url> fragments serialized once. Adding or editing a
+# post only rebuilds that post's fragments, and the documents are joined and
+# compressed again on the next feed request. Deleting a post from the window
+# marks it stale, and the next feed request refills it with one query.
+#
+# Each worker process has its own copy and only sees its own writes, so a
+# copy older than max_age is rebuilt from the database on the next request.
+
+FEEDS = {
+    'rss': 'application/rss+xml; charset=utf-8',
+    'atom': 'application/atom+xml; charset=utf-8',
+    'sitemap': 'application/xml; charset=utf-8',
+}
+
+
+def _utc(value):
+    # the database stores naive UTC
+    return (value or datetime(1970, 1, 1)).replace(tzinfo=timezone.utc)
+
+
+def _link(post):
+    if post.slug:
+        return url_for('main.post_by_slug', slug=post.slug, _external=True)
+    return url_for('main.post', id=post.id, _external=True)
+
+
+class _Item:
+    __slots__ = ('id', 'sort_key', 'last_modified', 'rss', 'atom', 'sitemap')
+
+    def __init__(self, post, summary):
+        link = escape(_link(post))
+        title = escape(post.title or '')
+        author = escape(post.author or '')
+        summary = escape(summary or '')
+        posted = _utc(post.date_posted)
+        updated = _utc(post.last_modified or post.date_posted)
+        self.id = post.id
+        self.sort_key = (post.date_posted or datetime.min, post.id)
+        self.last_modified = updated
+        self.rss = (f'<item><title>{title}</title><link>{link}</link><guid isPermaLink="true">{link}</guid>'
+                    f'<author>{author}</author><pubDate>{format_datetime(posted)}</pubDate>'
+                    f'<description>{summary}</description></item>')
+        self.atom = (f'<entry><title>{title}</title><link href="{link}"/><id>{link}</id>'
+                     f'<author><name>{author}</name></author><published>{posted.isoformat()}</published>'
+                     f'<updated>{updated.isoformat()}</updated><summary>{summary}</summary></entry>')
+        self.sitemap = f'<url><loc>{link}</loc><lastmod>{updated.isoformat()}</lastmod></url>'
+
+
+class _Document:
+    __slots__ = ('body', 'gzipped', 'etag', 'last_modified')
+
+    def __init__(self, text, last_modified):
+        self.body = text.encode('utf-8')
+        # mtime=0 keeps the gzip bytes the same for the same body
+        self.gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.last_modified = last_modified
+
+
+class FeedCache:
+    def __init__(self, feed_items=50, sitemap_items=1000, max_age=300, title='Flask Blog'):
+        self._lock = threading.Lock()
+        self.configure(feed_items, sitemap_items, max_age, title)
+
+    def configure(self, feed_items=50, sitemap_items=1000, max_age=300, title='Flask Blog'):
+        with self._lock:
+            self.feed_items = feed_items
+            self.sitemap_items = sitemap_items
+            self.max_age = max_age
+            self.title = title
+            self.built_at = None
+            self.stale = True
+            self.rebuilds = 0
+            self.updates = 0
+            self._items = []        # newest first
+            self._documents = None  # name -> _Document, None until the next feed request
+
+    @property
+    def window(self):
+        return max(self.feed_items, self.sitemap_items)
+
+    def ensure_fresh(self, load_posts):
+        # load_posts(limit) -> newest posts first
+        if self.stale or time.monotonic() - self.built_at >= self.max_age:
+            posts = load_posts(self.window)
+            with self._lock:
+                self._items = [_Item(post, post.excerpt) for post in posts]
+                self._documents = None
+                self.stale = False
+                self.built_at = time.monotonic()
+                self.rebuilds += 1
+        documents = self._documents
+        if documents is None:
+            with self._lock:
+                if self._documents is None:
+                    self._serialize()
+                documents = self._documents
+        return documents
+
+    def add(self, post):
+        # called after a post is created or edited, with its content loaded.
+        # The stored excerpt is filled in later by a background job.
+        from models import summarize  # models imports extensions, which imports this module
+        item = _Item(post, summarize(post.content)[0])
+        with self._lock:
+            if self.stale:
+                return
+            items = [i for i in self._items if i.id != post.id]
+            full = len(items) >= self.window
+            if full and item.sort_key < items[-1].sort_key:
+                # older than everything in the window
+                return
+            items.append(item)
+            items.sort(key=lambda i: i.sort_key, reverse=True)
+            self._items = items[:self.window]
+            self._documents = None
+            self.updates += 1
+
+    update = add
+
+    def remove(self, id):
+        with self._lock:
+            if any(i.id == id for i in self._items):
+                # a post from beyond the window moves up, let the next request load it
+                self.stale = True
+
+    def _serialize(self):
+        site = escape(url_for('main.index', _external=True))
+        feed_items = self._items[:self.feed_items]
+        updated = max((i.last_modified for i in feed_items), default=_utc(None))
+        title = escape(self.title)
+        rss = ('<?xml version="1.0" encoding="utf-8"?>\n<rss version="2.0"><channel>'
+               f'<title>{title}</title><link>{site}</link><description>{title}</description>'
+               f'<lastBuildDate>{format_datetime(updated)}</lastBuildDate>'
+               + ''.join(i.rss for i in feed_items) + '</channel></rss>\n')
+        atom = ('<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">'
+                f'<title>{title}</title><link href="{site}"/>'
+                f'<link rel="self" href="{escape(url_for("main.atom_feed", _external=True))}"/>'
+                f'<id>{site}</id><updated>{updated.isoformat()}</updated>'
+                + ''.join(i.atom for i in feed_items) + '</feed>\n')
+        sitemap_items = self._items[:self.sitemap_items]
+        sitemap_updated = max((i.last_modified for i in sitemap_items), default=_utc(None))
+        sitemap = ('<?xml version="1.0" encoding="utf-8"?>\n'
+                   '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                   f'<url><loc>{site}</loc></url>'
+                   + ''.join(i.sitemap for i in sitemap_items) + '</urlset>\n')
+        self._documents = {
+            'rss': _Document(rss, updated),
+            'atom': _Document(atom, updated),
+            'sitemap': _Document(sitemap, sitemap_updated),
+        }
+
+    def response(self, name, load_posts):
+        document = self.ensure_fresh(load_posts)[name]
+        use_gzip = request.accept_encodings['gzip'] > 0
+        # the two encodings are different bytes, so they get different ETags
+        etag = document.etag + ('-gz' if use_gzip else '')
+        app = current_app
+        if not is_resource_modified(request.environ, etag=etag, last_modified=document.last_modified):
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(document.gzipped if use_gzip else document.body, mimetype=FEEDS[name])
+            if use_gzip:
+                response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(etag)
+        response.last_modified = document.last_modified
+        response.vary.add('Accept-Encoding')
+        cache_control = app.config['CACHE_CONTROL'].get(request.endpoint)
+        if cache_control:
+            response.headers['Cache-Control'] = cache_control
+        return response
+
+    def stats(self):
+        return {
+            'items': len(self._items),
+            'rebuilds': self.rebuilds,
+            'updates': self.updates,
+            'bytes': {name: [len(d.body), len(d.gzipped)] for name, d in (self._documents or {}).items()},
+        }
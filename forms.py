@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, EmailField, SubmitField, PasswordField, BooleanField, ValidationError
+from wtforms import HiddenField, StringField, EmailField, SubmitField, PasswordField, BooleanField, ValidationError
 from wtforms.validators import DataRequired, email_validator, EqualTo, Length
 from wtforms.widgets import TextArea
 
@@ -14,6 +14,8 @@ class UserForm(FlaskForm):
                                                           EqualTo('password_hash2', 
                                                           message='Passwords Must Match')])
     password_hash2 = PasswordField('Confirm Password', validators=[DataRequired()])
+    # the row version the form was loaded with
+    version = HiddenField()
     submit = SubmitField('Submit')
 
 
@@ -23,6 +25,9 @@ class PostForm(FlaskForm):
     content = StringField('Content', validators=[DataRequired()], widget=TextArea())
     author = StringField('Author', validators=[DataRequired()])
     slug = StringField('Slug', validators=[DataRequired()])
+    # the row version and slug the form was loaded with
+    version = HiddenField()
+    old_slug = HiddenField()
     submit = SubmitField('Submit')
 
 
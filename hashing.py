@@ -0,0 +1,128 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+# PASSWORD HASHING POOL
+# Hashing is CPU bound, so it runs in a separate process pool instead of on the
+# request thread. Only a fixed number of jobs may be running or queued at once;
+# past that new requests are turned away straight away with HasherBusy.
+
+
+class HasherBusy(Exception):
+    def __init__(self, retry_after=1):
+        super().__init__('password hashing queue is full')
+        self.retry_after = retry_after
+
+
+# these run in the worker processes
+def _hash(password, method, salt_length):
+    return generate_password_hash(password, method=method, salt_length=salt_length)
+
+
+def _verify(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+def hash_prefix(method):
+    # the method as werkzeug writes it into a hash, 'pbkdf2:sha256' comes out
+    # as 'pbkdf2:sha256:260000'
+    if method.startswith('pbkdf2:'):
+        args = method[7:].split(':')
+        iterations = int(args[1] or 0) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{args[0]}:{iterations}'
+    return method
+
+
+def _mp_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class PasswordHasher:
+    def __init__(self, method='pbkdf2:sha256:260000', salt_length=16, workers=None, queue_size=None, timeout=10):
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.configure(method, salt_length, workers, queue_size, timeout)
+
+    def configure(self, method='pbkdf2:sha256:260000', salt_length=16, workers=None, queue_size=None, timeout=10):
+        # workers=0 hashes inline on the calling thread (handy for tests)
+        self.shutdown()
+        self.method = method
+        self.prefix = hash_prefix(method)
+        self.salt_length = salt_length
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.queue_size = self.workers * 4 if queue_size is None else queue_size
+        self.timeout = timeout
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(max(1, self.workers + self.queue_size))
+
+    def init_app(self, app):
+        self.configure(method=app.config['PASSWORD_HASH_METHOD'],
+                       salt_length=app.config['PASSWORD_SALT_LENGTH'],
+                       workers=app.config['HASH_WORKERS'],
+                       queue_size=app.config['HASH_QUEUE_SIZE'],
+                       timeout=app.config['HASH_TIMEOUT'])
+
+    def _executor(self):
+        # the pool is created lazily and again after a fork, so pre-fork
+        # servers get one pool per worker process. Workers come from a forkserver
+        # (spawn where there is none): forking a threaded server can copy a lock
+        # some other thread was holding, and the child hangs on it.
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context())
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _run(self, fn, *args):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HasherBusy()
+        if not self.workers:
+            try:
+                return fn(*args)
+            finally:
+                slots.release()
+        try:
+            future = self._executor().submit(fn, *args)
+        except Exception:
+            slots.release()
+            raise
+        # the slot is held until the job really finishes, even if we stop waiting
+        future.add_done_callback(lambda f: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HasherBusy()
+
+    def hash(self, password):
+        return self._run(_hash, password, self.method, self.salt_length)
+
+    def hash_many(self, passwords, chunksize=8):
+        # bulk hashing for CLI imports, spread over the whole pool and not
+        # subject to the request queue limit
+        passwords = list(passwords)
+        if not self.workers:
+            return [_hash(p, self.method, self.salt_length) for p in passwords]
+        n = len(passwords)
+        return list(self._executor().map(_hash, passwords, [self.method] * n, [self.salt_length] * n,
+                                         chunksize=chunksize))
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(_verify, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        # werkzeug hashes look like "method$salt$hash"
+        return not pwhash or pwhash.split('$', 1)[0] != self.prefix
+
+    def shutdown(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
@@ -0,0 +1,81 @@
+import json
+import logging
+import time
+from collections import Counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+# PER-REQUEST SQL INSTRUMENTATION
+# Counts and times every statement a request runs, reports the totals in a
+# Server-Timing header, optionally logs one JSON line per request, and warns
+# about slow statements and statements repeated often enough to look like N+1.
+
+logger = logging.getLogger('sql')
+
+
+class QueryInstrumentation:
+    def __init__(self):
+        self.server_timing = True
+        self.log_json = False
+        self.slow_query_ms = 250
+        self.repeat_threshold = 5
+
+    def init_app(self, app, engines):
+        self.server_timing = app.config['SQL_SERVER_TIMING']
+        self.log_json = app.config['SQL_LOG_JSON']
+        self.slow_query_ms = app.config['SQL_SLOW_QUERY_MS']
+        self.repeat_threshold = app.config['SQL_REPEAT_THRESHOLD']
+        for engine in engines:
+            self.instrument(engine)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def instrument(self, engine):
+        # also takes the sync_engine of an AsyncEngine
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = (time.perf_counter() - conn.info['query_start'].pop()) * 1000
+        endpoint = None
+        if has_request_context() and 'sql_stats' in g:
+            stats = g.sql_stats
+            stats['count'] += 1
+            stats['ms'] += elapsed
+            stats['statements'][statement] += 1
+            endpoint = request.endpoint
+        if self.slow_query_ms and elapsed >= self.slow_query_ms:
+            logger.warning('slow query %.1f ms on %s: %s', elapsed, endpoint, statement)
+
+    def _start_request(self):
+        g.sql_stats = {'count': 0, 'ms': 0.0, 'statements': Counter(), 'started': time.perf_counter()}
+
+    def _finish_request(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+        total_ms = (time.perf_counter() - stats['started']) * 1000
+
+        repeated = [(statement, n) for statement, n in stats['statements'].most_common()
+                    if n >= self.repeat_threshold]
+        for statement, n in repeated:
+            logger.warning('possible N+1 on %s: statement ran %d times: %s', request.endpoint, n, statement)
+
+        if self.server_timing:
+            response.headers.add('Server-Timing', f'db;dur={stats["ms"]:.2f};desc="{stats["count"]} queries"')
+            response.headers.add('Server-Timing', f'app;dur={total_ms:.2f}')
+        if self.log_json:
+            logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'queries': stats['count'],
+                'db_ms': round(stats['ms'], 3),
+                'total_ms': round(total_ms, 3),
+                'repeated': [{'statement': s, 'count': n} for s, n in repeated],
+            }))
+        return response
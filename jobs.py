@@ -0,0 +1,21 @@
+from extensions import db, task_queue
+from models import Posts, summarize
+
+# BACKGROUND JOBS
+# Task functions run by the task queue after the request has returned. They
+# get JSON-safe arguments (ids, not objects), run in an app context on a worker
+# thread, and may run more than once, so they must be safe to repeat.
+
+
+@task_queue.task('refresh_post_summary')
+def refresh_post_summary(post_id):
+    # excerpt, word count and reading time for the listing
+    post = db.session.get(Posts, post_id)
+    if post is None:
+        # deleted before the job ran
+        return
+    summary = summarize(post.content)
+    if summary != (post.excerpt, post.word_count, post.reading_time):
+        # a real change, so last_modified moves on and cached listings revalidate
+        post.refresh_summary()
+        db.session.commit()
@@ -0,0 +1,155 @@
+import math
+import re
+from datetime import datetime
+from flask_login import UserMixin
+from sqlalchemy import event, func, inspect, select, update
+from extensions import db, login_manager, password_hasher, user_cache
+
+# Listing summaries, worked out once when a post is written
+EXCERPT_CHARS = 280
+WORDS_PER_MINUTE = 200
+
+def summarize(content):
+    # returns (excerpt, word count, reading time in minutes)
+    text = ' '.join((content or '').split())
+    words = len(re.findall(r'\w+', text))
+    if len(text) > EXCERPT_CHARS:
+        cut = text.rfind(' ', 0, EXCERPT_CHARS)
+        text = text[:cut if cut > 0 else EXCERPT_CHARS].rstrip() + '\u2026'
+    return text, words, max(1, math.ceil(words / WORDS_PER_MINUTE))
+
+# DB Models
+# USERS DATABASE MODEL
+class Users(db.Model, UserMixin): 
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(20), nullable=False, unique=True)
+    name = db.Column(db.String(120), nullable=False)
+    email = db.Column(db.String(120), nullable=False, unique=True)
+    favorite_color = db.Column(db.String(120))
+    date_added = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # kept in step with the posts table by the Posts mapper events below
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # bumped by versioned_update() on every profile edit
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # delete_user() detaches the posts with one UPDATE, the ORM need not load them
+    posts = db.relationship('Posts', back_populates='user', passive_deletes=True)
+    
+    #password section
+    password_hash = db.Column(db.String(128))
+
+    @property
+    def password(self): 
+        raise AttributeError('Password is not a readable attribute')
+    
+    @password.setter
+    def password(self, password):
+        self.password_hash = password_hasher.hash(password)
+
+    def verify_password(self, password):
+        return password_hasher.verify(self.password_hash, password)
+
+    #create a string repr
+    def __repr__(self): 
+        return f'DB Name: {self.name}'
+
+
+# BLOG POST DATABASE MODEL
+class Posts(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(255))
+    content = db.Column(db.Text)
+    author = db.Column(db.String(255), index=True)
+    date_posted = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    slug = db.Column(db.String(255), index=True, unique=True)
+    last_modified = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    excerpt = db.Column(db.String(300))
+    word_count = db.Column(db.Integer)
+    reading_time = db.Column(db.Integer)
+    # bumped by versioned_update() on every edit, the summary job leaves it alone
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # the account that wrote the post, author stays as the displayed byline
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
+    user = db.relationship('Users', back_populates='posts')
+
+    # one author's posts in date order, also serves the foreign key
+    __table_args__ = (db.Index('ix_posts_user_id_date_posted', 'user_id', 'date_posted'),)
+
+    def refresh_summary(self):
+        self.excerpt, self.word_count, self.reading_time = summarize(self.content)
+
+
+# OLD SLUGS, answered with a permanent redirect to the post's current slug
+class SlugRedirects(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(255), nullable=False, index=True, unique=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), nullable=False, index=True)
+    date_added = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# POST COUNTS
+# Bumped in the same transaction as the insert / delete / reassignment, as a
+# single UPDATE users SET post_count = post_count +/- 1, so concurrent writers
+# do not lose counts. Core bulk inserts skip these events and call
+# recount_posts() afterwards.
+def _bump_post_count(connection, user_id, delta):
+    if user_id is not None:
+        users = Users.__table__
+        connection.execute(update(users).where(users.c.id == user_id)
+                           .values(post_count=users.c.post_count + delta))
+
+@event.listens_for(Posts, 'after_insert')
+def _post_inserted(mapper, connection, post):
+    _bump_post_count(connection, post.user_id, 1)
+
+@event.listens_for(Posts, 'after_delete')
+def _post_deleted(mapper, connection, post):
+    _bump_post_count(connection, post.user_id, -1)
+
+@event.listens_for(Posts, 'after_update')
+def _post_updated(mapper, connection, post):
+    history = inspect(post).attrs.user_id.history
+    if history.has_changes():
+        for old in history.deleted:
+            _bump_post_count(connection, old, -1)
+        _bump_post_count(connection, post.user_id, 1)
+
+def recount_posts(user_ids=None):
+    # recompute post_count from the posts table, for every user or the given ids
+    users, posts = Users.__table__, Posts.__table__
+    count = select(func.count(posts.c.id)).where(posts.c.user_id == users.c.id).scalar_subquery()
+    stmt = update(users).values(post_count=count)
+    if user_ids is not None:
+        stmt = stmt.where(users.c.id.in_(user_ids))
+    db.session.execute(stmt)
+
+
+# OPTIMISTIC VERSIONING
+# A form edit is saved with one UPDATE ... WHERE id = ? AND version = ? that
+# also bumps the version, instead of loading the row and flushing it. No match
+# means the row is gone or somebody saved it after the form was loaded. Only
+# form edits bump the version, so background writes (summaries, post counts)
+# never show up as conflicts.
+def versioned_update(model, id, version, *criteria, **values):
+    # returns the updated object, or None when nothing matched
+    stmt = (update(model).where(model.id == id, model.version == version, *criteria)
+            .values(version=model.version + 1, **values))
+    if db.session.get_bind(model.__mapper__).dialect.update_returning:
+        return db.session.scalars(stmt.returning(model), execution_options={'populate_existing': True}).first()
+    # no UPDATE ... RETURNING (MySQL), read the new row back
+    if db.session.execute(stmt).rowcount == 0:
+        return None
+    return db.session.get(model, id, populate_existing=True)
+
+
+@login_manager.user_loader
+def load_user(user_id): 
+    id = int(user_id)
+    user = user_cache.get(id)
+    if user is None:
+        user = Users.query.get(id)
+        if user is None:
+            return None
+        db.session.expunge(user)
+        user_cache.set(id, user)
+    # attach a private copy to this request's session without a query
+    return db.session.merge(user, load=False)
@@ -0,0 +1,150 @@
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+# KEYSET (CURSOR) PAGINATION
+# Pages are found by seeking past the last row seen on (sort column, id) instead
+# of using OFFSET, so every page costs the same no matter how deep it is.
+
+def encode_cursor(value, id):
+    raw = f'{value.isoformat()}|{id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    # returns (datetime, id) or None if the cursor is missing or malformed
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(value), int(id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _seek(sort_column, id_column, key, forward):
+    value, id = key
+    if forward:
+        return or_(sort_column > value, and_(sort_column == value, id_column > id))
+    return or_(sort_column < value, and_(sort_column == value, id_column < id))
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor, prev_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class StreamedKeysetPage(KeysetPage):
+    # rows come off the cursor while the page is being rendered; the cursors
+    # are only known once the rows have been iterated, so templates must use
+    # them after the loop
+    def __init__(self, rows, per_page, key, cursor_for):
+        super().__init__(None, None, None)
+        self._rows = rows
+        self._per_page = per_page
+        self._key = key
+        self._cursor_for = cursor_for
+
+    def __iter__(self):
+        first = last = None
+        count = 0
+        for row in self._rows:
+            if count == self._per_page:
+                # the extra row only tells us there is another page
+                self.next_cursor = self._cursor_for(last)
+                break
+            if first is None:
+                first = row
+                if self._key is not None:
+                    self.prev_cursor = self._cursor_for(first)
+            last = row
+            count += 1
+            yield row
+
+    def __len__(self):
+        raise TypeError('a streamed page has no length until it has been iterated')
+
+
+def keyset_order(query, sort_column, id_column, after=None, before=None, newest_first=False):
+    # filters and orders a Query or select() for one page.
+    # returns (query, backwards, key) for keyset_page()
+    backwards = before is not None and after is None
+    key = before if backwards else after
+
+    # "forward" here means ascending in the database
+    ascending = newest_first == backwards
+    if key is not None:
+        query = query.filter(_seek(sort_column, id_column, key, ascending))
+    if ascending:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+    else:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    return query, backwards, key
+
+
+def _cursor_for(sort_column, id_column):
+    sort_attr = sort_column.key
+    id_attr = id_column.key
+
+    def cursor_for(row):
+        return encode_cursor(getattr(row, sort_attr), getattr(row, id_attr))
+    return cursor_for
+
+
+def keyset_page(rows, sort_column, id_column, per_page, backwards, key):
+    # rows: up to per_page + 1 rows fetched from the keyset_order() query
+    cursor_for = _cursor_for(sort_column, id_column)
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if backwards:
+            # we came here from a later page, and there may be more before us
+            next_cursor = cursor_for(rows[-1])
+            prev_cursor = cursor_for(rows[0]) if has_more else None
+        else:
+            next_cursor = cursor_for(rows[-1]) if has_more else None
+            prev_cursor = cursor_for(rows[0]) if key is not None else None
+    return KeysetPage(rows, next_cursor, prev_cursor)
+
+
+def keyset_paginate(query, sort_column, id_column, per_page, after=None, before=None, newest_first=False,
+                    stream=False):
+    # after/before are decoded cursors; "after" walks forward in display order,
+    # "before" walks backwards and the rows are flipped back before returning.
+    # stream=True hands back rows as they are fetched (forward pages only,
+    # backward pages are small and need reversing anyway)
+    query, backwards, key = keyset_order(query, sort_column, id_column, after, before, newest_first)
+    if stream and not backwards:
+        return StreamedKeysetPage(query.limit(per_page + 1).yield_per(min(per_page + 1, 100)),
+                                  per_page, key, _cursor_for(sort_column, id_column))
+    rows = query.limit(per_page + 1).all()
+    return keyset_page(rows, sort_column, id_column, per_page, backwards, key)
+
+
+async def keyset_paginate_async(session, stmt, sort_column, id_column, per_page, after=None, before=None,
+                                newest_first=False):
+    # the same page of a select() through an AsyncSession
+    stmt, backwards, key = keyset_order(stmt, sort_column, id_column, after, before, newest_first)
+    rows = (await session.scalars(stmt.limit(per_page + 1))).all()
+    return keyset_page(list(rows), sort_column, id_column, per_page, backwards, key)
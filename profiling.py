@@ -0,0 +1,163 @@
+import cProfile
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from werkzeug.wsgi import ClosingIterator
+
+# SAMPLING PROFILER MIDDLEWARE
+# Opt-in WSGI middleware for finding where slow requests spend their time.
+#
+# * A random sample of requests (sample_rate) runs under cProfile and is written
+#   out as a .pstats file plus a .collapsed stack file.
+# * Any other request still running after slow_ms starts having its stack
+#   sampled every interval_ms by a watchdog thread, and is written out as a
+#   .collapsed file once it finishes.
+#
+# .collapsed files are "frame;frame;frame count" lines, ready for flamegraph.pl
+# or speedscope. Unsampled fast requests only pay for a dict insert and a
+# random() call. The output directory is pruned oldest first to stay under
+# max_bytes and max_files.
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class _Request:
+    __slots__ = ('started', 'sampling', 'stacks')
+
+    def __init__(self, sampling):
+        self.started = time.perf_counter()
+        self.sampling = sampling
+        self.stacks = Counter()
+
+
+class SamplingProfiler:
+    def __init__(self, app, directory='profiles', sample_rate=0.0, slow_ms=None,
+                 interval_ms=5, max_bytes=100 * 1024 * 1024, max_files=500):
+        self.app = app
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.interval = interval_ms / 1000
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._active = {}                       # thread id -> _Request
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._cprofile_lock = threading.Lock()  # cProfile can only run one at a time
+        self._watchdog = None
+        self._seq = itertools.count()
+        os.makedirs(directory, exist_ok=True)
+
+    def _start_watchdog(self):
+        if self._watchdog is None or not self._watchdog.is_alive():
+            self._watchdog = threading.Thread(target=self._watch, name='sampling-profiler', daemon=True)
+            self._watchdog.start()
+
+    def _watch(self):
+        # sleeps on an event while no requests are running
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+                    continue
+                due = [(tid, req) for tid, req in self._active.items()
+                       if req.sampling or (self.slow_ms and (now - req.started) * 1000 >= self.slow_ms)]
+            if not due:
+                continue
+            frames = sys._current_frames()
+            for tid, req in due:
+                frame = frames.get(tid)
+                if frame is not None:
+                    req.stacks[_collapse(frame)] += 1
+
+    def __call__(self, environ, start_response):
+        sampling = self.sample_rate and random.random() < self.sample_rate
+        if not sampling and not self.slow_ms:
+            return self.app(environ, start_response)
+
+        tid = threading.get_ident()
+        req = _Request(sampling)
+        profiler = None
+        if sampling and self._cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+        with self._lock:
+            self._active[tid] = req
+        self._start_watchdog()
+        self._wake.set()
+
+        def finish():
+            if profiler is not None:
+                profiler.disable()
+                self._cprofile_lock.release()
+            with self._lock:
+                self._active.pop(tid, None)
+            elapsed_ms = (time.perf_counter() - req.started) * 1000
+            if req.sampling or req.stacks:
+                self._write(environ, elapsed_ms, profiler, req.stacks)
+
+        if profiler is not None:
+            try:
+                profiler.enable()
+            except ValueError:
+                # another profiler (a debugger, say) already owns the hooks
+                self._cprofile_lock.release()
+                profiler = None
+        try:
+            app_iter = self.app(environ, start_response)
+        except BaseException:
+            finish()
+            raise
+        # streamed bodies keep being profiled until the server closes them
+        return ClosingIterator(app_iter, [finish])
+
+    def _write(self, environ, elapsed_ms, profiler, stacks):
+        path = re.sub(r'[^A-Za-z0-9]+', '_', environ.get('PATH_INFO', '')).strip('_') or 'root'
+        name = '{}-{}.{}-{}-{}-{:.0f}ms'.format(time.strftime('%Y%m%d%H%M%S'), os.getpid(), next(self._seq),
+                                                environ.get('REQUEST_METHOD', 'GET'), path[:60], elapsed_ms)
+        base = os.path.join(self.directory, name)
+        try:
+            if profiler is not None:
+                profiler.dump_stats(base + '.pstats')
+            if stacks:
+                with open(base + '.collapsed', 'w') as f:
+                    for stack, count in stacks.most_common():
+                        f.write(f'{stack} {count}\n')
+            self._prune()
+        except OSError:
+            # profiling must never break the request
+            pass
+
+    def _prune(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(('.pstats', '.collapsed')):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        while entries and (total > self.max_bytes or len(entries) > self.max_files):
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
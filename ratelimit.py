@@ -0,0 +1,179 @@
+import functools
+import math
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from flask import current_app, request
+
+# RATE LIMITING
+# Token buckets keyed by client IP and by the username being tried. A bucket
+# holds up to `capacity` tokens and refills at `capacity / period` tokens a
+# second; every attempt takes one. The check runs in a decorator before the
+# view, so a rejected request never reaches form validation, password hashing
+# or the database.
+#
+# Limits are "capacity/period_seconds" strings in config, e.g. '10/60'.
+# Storage is pluggable, anything with take() and reset() will do:
+#   memory                         buckets in this process, sharded dicts
+#   sqlite:////dev/shm/limits.db   one file shared by every worker on the
+#                                  host (on /dev/shm it never touches disk)
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after=1):
+        super().__init__('too many attempts')
+        self.retry_after = retry_after
+
+
+def parse_limit(value):
+    # '10/60' -> (capacity 10, refill rate in tokens per second)
+    capacity, period = value.split('/')
+    return float(capacity), float(capacity) / float(period)
+
+
+def _refill(tokens, updated, now, capacity, rate):
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+class MemoryStorage:
+    def __init__(self, shards=16, max_keys=100000, idle=3600):
+        self.idle = idle
+        self.max_keys_per_shard = max(1, max_keys // shards)
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def _shard(self, key):
+        return self._shards[zlib.crc32(key.encode('utf-8')) % len(self._shards)]
+
+    def take(self, key, capacity, rate, cost=1):
+        # returns (allowed, seconds until enough tokens)
+        buckets, lock = self._shard(key)
+        now = time.monotonic()
+        with lock:
+            bucket = buckets.get(key)
+            tokens = capacity if bucket is None else _refill(bucket[0], bucket[1], now, capacity, rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            if bucket is None and len(buckets) >= self.max_keys_per_shard:
+                self._prune(buckets, now)
+            buckets[key] = (tokens, now)
+        return allowed, 0 if allowed else (cost - tokens) / rate
+
+    def reset(self, key):
+        buckets, lock = self._shard(key)
+        with lock:
+            buckets.pop(key, None)
+
+    def _prune(self, buckets, now):
+        # idle buckets have refilled, dropping them loses nothing
+        for key in [k for k, (_, updated) in buckets.items() if now - updated > self.idle]:
+            del buckets[key]
+
+
+class SQLiteStorage:
+    def __init__(self, path, idle=3600):
+        self.path = path
+        self.idle = idle
+        self._takes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, '
+                         'updated REAL NOT NULL)')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA synchronous=OFF')
+        return conn
+
+    def take(self, key, capacity, rate, cost=1):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = capacity if row is None else _refill(row[0], row[1], now, capacity, rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute('INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) ON CONFLICT (key) '
+                         'DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated', (key, tokens, now))
+            self._takes += 1
+            if self._takes % 1000 == 0:
+                conn.execute('DELETE FROM buckets WHERE updated < ?', (now - self.idle,))
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return allowed, 0 if allowed else (cost - tokens) / rate
+
+    def reset(self, key):
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM buckets WHERE key = ?', (key,))
+        finally:
+            conn.close()
+
+
+def storage_from_url(url):
+    if url == 'memory':
+        return MemoryStorage()
+    if url.startswith('sqlite:///'):
+        return SQLiteStorage(url[len('sqlite:///'):])
+    raise ValueError(f'unknown rate limit storage {url!r}')
+
+
+def client_ip():
+    # behind a proxy, wrap the app in werkzeug's ProxyFix so this is the client
+    return request.remote_addr or 'unknown'
+
+
+def posted_username():
+    return (request.form.get('username') or '').strip().lower() or None
+
+
+class RateLimiter:
+    def __init__(self, enabled=True, storage='memory'):
+        self.configure(enabled, storage)
+
+    def configure(self, enabled=True, storage='memory'):
+        self.enabled = enabled
+        self.storage = storage_from_url(storage) if isinstance(storage, str) else storage
+        self.rejected = 0
+
+    def init_app(self, app):
+        self.configure(enabled=app.config['RATELIMIT_ENABLED'], storage=app.config['RATELIMIT_STORAGE'])
+
+    def limit(self, scope, config_key, key, methods=('POST',)):
+        # limit a view with the bucket app.config[config_key], one per key()
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.enabled and request.method in methods:
+                    self.check(scope, config_key, key())
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def check(self, scope, config_key, value):
+        if value is None:
+            return
+        capacity, rate = parse_limit(current_app.config[config_key])
+        allowed, retry_after = self.storage.take(f'{scope}:{value}', capacity, rate)
+        if not allowed:
+            self.rejected += 1
+            raise RateLimited(max(1, math.ceil(retry_after)))
+
+    def reset(self, scope, value):
+        self.storage.reset(f'{scope}:{value}')
+
+    def stats(self):
+        return {'enabled': self.enabled, 'storage': type(self.storage).__name__, 'rejected': self.rejected}
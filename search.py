@@ -0,0 +1,274 @@
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from markupsafe import Markup, escape
+
+# IN-PROCESS FULL TEXT SEARCH
+# An inverted index over post title, author and content ranked with BM25.
+# Only postings are kept in memory, the matching rows are loaded from the
+# database a page at a time.
+#
+# Each worker process keeps its own copy. A background thread builds it when
+# the worker starts, then every `refresh` seconds catches up with other
+# workers' writes: rows modified since the last pass are re-indexed, ids never
+# seen are added and ids gone from the table are dropped. Rows are read and
+# tokenized outside the lock, searches and this worker's own writes only wait
+# for the postings to be swapped in.
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+STOP_WORDS = frozenset('a an and are as at be by for from has have in is it of on or that the this to was were will with'.split())
+
+# a hit in the title counts more than one in the body
+FIELD_WEIGHTS = {'title': 3, 'author': 2, 'content': 1}
+
+# rows modified this close before the last pass are read again, in case their
+# transaction committed after it
+CATCH_UP_OVERLAP = timedelta(seconds=60)
+IDS_PER_QUERY = 500
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOP_WORDS]
+
+
+def analyze(title, content, author):
+    # (weighted term frequencies, weighted length) of one post
+    freqs = defaultdict(int)
+    length = 0
+    for field, text in (('title', title), ('author', author), ('content', content)):
+        weight = FIELD_WEIGHTS[field]
+        for term in tokenize(text):
+            freqs[term] += weight
+            length += weight
+    return freqs, length
+
+
+class SearchIndex:
+    def __init__(self, k1=1.2, b=0.75, refresh=300):
+        self.k1 = k1
+        self.b = b
+        self.built = False
+        self.watermark = None               # newest last_modified indexed
+        self.app = None
+        self.load_rows = self.load_ids = None
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._touched = None                # ids written while a refresh runs
+        self._pid = None
+        self._thread = None
+        self.configure(refresh)
+        self._clear()
+
+    def configure(self, refresh=300):
+        # refresh=0 runs no thread, the first search builds the index (handy for tests)
+        self.refresh = refresh
+
+    def init_app(self, app, load_rows, load_ids):
+        # load_rows(since=None, ids=None) -> (id, title, content, author, last_modified) rows
+        # load_ids() -> (id,) rows
+        self.app = app
+        self.load_rows = load_rows
+        self.load_ids = load_ids
+        self.configure(refresh=app.config['SEARCH_INDEX_REFRESH'])
+        # started with the first request, so pre-fork servers build in each worker
+        app.before_request(self._ensure_started)
+
+    def _clear(self):
+        self.postings = defaultdict(dict)   # term -> {post id: weighted term frequency}
+        self.doc_terms = {}                 # post id -> terms, so a post can be removed
+        self.doc_len = {}                   # post id -> weighted length
+        self.total_len = 0
+
+    def build(self, rows):
+        # rows: iterable of (id, title, content, author, last_modified), indexed
+        # into a fresh copy while searches keep using this one
+        with self._refresh_lock:
+            with self._lock:
+                self._touched = set()
+            fresh = SearchIndex(self.k1, self.b)
+            watermark = None
+            try:
+                for id, title, content, author, last_modified in rows:
+                    fresh._insert(id, *analyze(title, content, author))
+                    if last_modified is not None and (watermark is None or last_modified > watermark):
+                        watermark = last_modified
+            except BaseException:
+                with self._lock:
+                    self._touched = None
+                raise
+            with self._lock:
+                # writes made meanwhile went to this copy, carry them over
+                for id in self._touched:
+                    fresh._remove(id)
+                    if id in self.doc_len:
+                        fresh._insert(id, *self._doc(id))
+                self.postings, self.doc_terms = fresh.postings, fresh.doc_terms
+                self.doc_len, self.total_len = fresh.doc_len, fresh.total_len
+                self.watermark = watermark
+                self.built = True
+                self._touched = None
+
+    def catch_up(self, load_rows, load_ids):
+        with self._refresh_lock:
+            with self._lock:
+                self._touched = set()
+                known = set(self.doc_len)
+            docs = {}
+            watermark = self.watermark
+            try:
+                def read(rows):
+                    nonlocal watermark
+                    for id, title, content, author, last_modified in rows:
+                        docs[id] = analyze(title, content, author)
+                        if last_modified is not None and (watermark is None or last_modified > watermark):
+                            watermark = last_modified
+
+                since = self.watermark - CATCH_UP_OVERLAP if self.watermark is not None else None
+                if since is not None:
+                    read(load_rows(since=since))
+                ids = {id for id, in load_ids()}
+                # new posts whose last_modified is older than the watermark, e.g. imported ones
+                missing = sorted(ids - known - set(docs))
+                for i in range(0, len(missing), IDS_PER_QUERY):
+                    read(load_rows(ids=missing[i:i + IDS_PER_QUERY]))
+            except BaseException:
+                with self._lock:
+                    self._touched = None
+                raise
+            with self._lock:
+                # this worker's own writes since the pass started are newer
+                for id, doc in docs.items():
+                    if id not in self._touched:
+                        self._remove(id)
+                        self._insert(id, *doc)
+                for id in known - ids - self._touched:
+                    self._remove(id)
+                self.watermark = watermark
+                self._touched = None
+            return len(docs), len(known - ids)
+
+    def ensure_built(self, load_rows):
+        # without the refresh thread the first search builds the index
+        if not self.built and not self.refresh:
+            self.build(load_rows())
+
+    def _ensure_started(self):
+        if not self.refresh:
+            return
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='search-index', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    if self.built:
+                        self.catch_up(self.load_rows, self.load_ids)
+                    else:
+                        self.build(self.load_rows())
+            except Exception:
+                logger.exception('search index refresh failed')
+            time.sleep(self.refresh)
+
+    def add(self, post):
+        doc = analyze(post.title, post.content, post.author)
+        with self._lock:
+            self._remove(post.id)
+            self._insert(post.id, *doc)
+            if self._touched is not None:
+                self._touched.add(post.id)
+
+    # editing a post is a remove followed by an add
+    update = add
+
+    def remove(self, id):
+        with self._lock:
+            self._remove(id)
+            if self._touched is not None:
+                self._touched.add(id)
+
+    def _doc(self, id):
+        return {term: self.postings[term][id] for term in self.doc_terms[id]}, self.doc_len[id]
+
+    def _insert(self, id, freqs, length):
+        for term, tf in freqs.items():
+            self.postings[term][id] = tf
+        self.doc_terms[id] = tuple(freqs)
+        self.doc_len[id] = length
+        self.total_len += length
+
+    def _remove(self, id):
+        terms = self.doc_terms.pop(id, None)
+        if terms is None:
+            return
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(id, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_len -= self.doc_len.pop(id)
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def search(self, query, page=1, per_page=10):
+        # returns (total hits, [(post id, score), ...] for the requested page)
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self.doc_len)
+            if not terms or not n:
+                return 0, []
+            avg_len = self.total_len / n
+            scores = defaultdict(float)
+            for term in terms:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                for id, tf in docs.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_len[id] / avg_len)
+                    scores[id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        top = heapq.nlargest(page * per_page, scores.items(), key=lambda item: (item[1], item[0]))
+        return len(scores), top[(page - 1) * per_page:]
+
+
+def highlight(text, query, width=240):
+    # escaped snippet of text around the first match with the query terms wrapped in <mark>
+    if not text:
+        return Markup('')
+    terms = set(tokenize(query))
+    if not terms:
+        return escape(text[:width])
+    pattern = re.compile(r'\b(' + '|'.join(re.escape(t) for t in sorted(terms, key=len, reverse=True)) + r')\b', re.IGNORECASE)
+    match = pattern.search(text)
+    start = 0
+    if match and len(text) > width:
+        start = max(0, min(match.start() - width // 4, len(text) - width))
+    snippet = text[start:start + width]
+
+    out = []
+    last = 0
+    for m in pattern.finditer(snippet):
+        out.append(escape(snippet[last:m.start()]))
+        out.append(Markup('<mark>%s</mark>') % snippet[m.start():m.end()])
+        last = m.end()
+    out.append(escape(snippet[last:]))
+    prefix = '&hellip;' if start > 0 else ''
+    suffix = '&hellip;' if start + width < len(text) else ''
+    return Markup(prefix) + Markup('').join(out) + Markup(suffix)
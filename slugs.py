@@ -0,0 +1,80 @@
+import threading
+
+# IN-PROCESS SLUG MAP
+# slug -> post id for every live post, so /blog/<slug>/ resolves with a primary
+# key lookup instead of a query on the slug index. Filled from the posts table
+# on first use and kept current by the routes that create, edit and delete
+# posts. Each worker process has its own copy; a slug changed by another worker
+# is caught when the loaded post's slug no longer matches.
+
+
+class SlugMap:
+    def __init__(self):
+        self.built = False
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._ids = {}      # slug -> post id
+        self._slugs = {}    # post id -> slug, so an edit can drop the old slug
+
+    def build(self, rows):
+        # rows: iterable of (id, slug)
+        ids = {}
+        slugs = {}
+        for id, slug in rows:
+            if slug:
+                ids[slug] = id
+                slugs[id] = slug
+        with self._lock:
+            self._ids = ids
+            self._slugs = slugs
+            self.built = True
+
+    def ensure_built(self, load_rows):
+        if not self.built:
+            self.build(load_rows())
+
+    def get(self, slug):
+        with self._lock:
+            id = self._ids.get(slug)
+            if id is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return id
+
+    def add(self, post):
+        with self._lock:
+            self._remove(post.id)
+            if post.slug:
+                self._ids[post.slug] = post.id
+                self._slugs[post.id] = post.slug
+
+    # editing a post replaces its old slug
+    update = add
+
+    def remove(self, id):
+        with self._lock:
+            self._remove(id)
+
+    def discard(self, slug):
+        # drop a stale entry found on lookup
+        with self._lock:
+            id = self._ids.pop(slug, None)
+            if id is not None and self._slugs.get(id) == slug:
+                del self._slugs[id]
+
+    def _remove(self, id):
+        slug = self._slugs.pop(id, None)
+        if slug is not None and self._ids.get(slug) == id:
+            del self._ids[slug]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'items': len(self._ids),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else None,
+            }
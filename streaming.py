@@ -0,0 +1,45 @@
+from flask import current_app, get_flashed_messages, stream_with_context
+from markupsafe import Markup
+
+# STREAMED TEMPLATE RENDERING
+# Listing pages can be sent while they render instead of being built in memory
+# first. Templates put {{ stream_flush }} just before their row loop; everything
+# above it (page head, navbar, form) goes out as the first chunk, before any
+# rows are fetched. Rows are then sent in chunks of about chunk_size characters.
+# The marker renders as nothing when the page is not streamed.
+
+FLUSH_MARKER = '<!-- stream-flush -->'
+
+
+def _chunks(pieces, chunk_size):
+    buffer = []
+    size = 0
+    for piece in pieces:
+        if FLUSH_MARKER in piece:
+            before, after = piece.split(FLUSH_MARKER, 1)
+            buffer.append(before)
+            yield ''.join(buffer)
+            buffer = [after]
+            size = len(after)
+            continue
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_page(template_name, **context):
+    app = current_app._get_current_object()
+    # the session cookie is written before the body streams, so flashed
+    # messages have to be taken out of the session now
+    get_flashed_messages()
+    context['stream_flush'] = Markup(FLUSH_MARKER)
+    app.update_template_context(context)
+    template = app.jinja_env.get_or_select_template(template_name)
+    pieces = template.generate(context)
+    return app.response_class(stream_with_context(_chunks(pieces, app.config['STREAM_CHUNK_SIZE'])),
+                              mimetype='text/html')
@@ -0,0 +1,316 @@
+import atexit
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# BACKGROUND TASK QUEUE
+# Side work that does not have to finish before the response goes out is
+# enqueued after the request's commit and run on a small thread pool.
+#
+# * Jobs are stored in their own SQLite file, so queued work survives a
+#   restart. Every worker process runs a dispatcher that claims due jobs from
+#   that file; a job is only ever claimed by one of them.
+# * A failed job is retried with exponential backoff until max_attempts.
+# * A job enqueued with a key that is already in the store is not added again.
+#   Finished jobs keep their key until they are pruned after `retention`.
+# * A claim is a lease. A job whose worker died is picked up again once its
+#   lease runs out.
+# * shutdown() stops claiming and waits for running jobs. Queued jobs stay in
+#   the file for the next start.
+#
+# workers=0 runs jobs inline at enqueue time, with no store (handy for tests).
+
+logger = logging.getLogger('tasks')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    args TEXT NOT NULL,
+    key TEXT UNIQUE,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    locked_until REAL,
+    last_error TEXT,
+    created REAL NOT NULL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at);
+'''
+
+
+class _Task:
+    __slots__ = ('fn', 'max_attempts')
+
+    def __init__(self, fn, max_attempts):
+        self.fn = fn
+        self.max_attempts = max_attempts
+
+
+class TaskQueue:
+    def __init__(self, path=None, workers=2, poll_interval=1.0, backoff=2.0, backoff_max=300.0,
+                 lease=300.0, retention=86400.0, drain_timeout=30.0):
+        self.tasks = {}                         # name -> _Task
+        self.app = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._dispatcher = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self.configure(path, workers, poll_interval, backoff, backoff_max, lease, retention, drain_timeout)
+
+    def configure(self, path=None, workers=2, poll_interval=1.0, backoff=2.0, backoff_max=300.0,
+                  lease=300.0, retention=86400.0, drain_timeout=30.0):
+        self.shutdown()
+        self.path = path
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.lease = lease
+        self.retention = retention
+        self.drain_timeout = drain_timeout
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self._slots = threading.BoundedSemaphore(max(1, workers))
+        if path and workers:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            conn = self._connect()
+            try:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.executescript(SCHEMA)
+            finally:
+                conn.close()
+
+    def init_app(self, app):
+        self.app = app
+        self.configure(path=app.config['TASK_QUEUE_PATH'] or os.path.join(app.instance_path, 'tasks.sqlite3'),
+                       workers=app.config['TASK_WORKERS'],
+                       poll_interval=app.config['TASK_POLL_INTERVAL'],
+                       backoff=app.config['TASK_BACKOFF'],
+                       backoff_max=app.config['TASK_BACKOFF_MAX'],
+                       lease=app.config['TASK_LEASE'],
+                       retention=app.config['TASK_RETENTION'],
+                       drain_timeout=app.config['TASK_DRAIN_TIMEOUT'])
+        # leftover jobs start running with the first request, not at import
+        # time, so pre-fork servers start a dispatcher in each worker
+        app.before_request(self._ensure_started)
+        atexit.register(self.shutdown)
+
+    def task(self, name=None, max_attempts=5):
+        def register(fn):
+            self.tasks[name or fn.__name__] = _Task(fn, max_attempts)
+            return fn
+        return register
+
+    def _connect(self):
+        # short lived connections, sqlite3 connections are not shared between threads
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    # ENQUEUE
+    def enqueue(self, name, *args, key=None, delay=0, **kwargs):
+        # returns the job id, or the id of the job already holding `key`
+        task = self.tasks[name]
+        if not self.workers:
+            try:
+                self._call(task.fn, args, kwargs)
+            except Exception:
+                logger.exception('task %s failed', name)
+            return None
+        now = time.time()
+        payload = json.dumps({'args': args, 'kwargs': kwargs})
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO jobs (name, args, key, max_attempts, run_at, created) VALUES (?, ?, ?, ?, ?, ?)',
+                (name, payload, key, task.max_attempts, now + delay, now))
+            if cursor.rowcount:
+                id = cursor.lastrowid
+            else:
+                id = conn.execute('SELECT id FROM jobs WHERE key = ?', (key,)).fetchone()[0]
+        finally:
+            conn.close()
+        self._ensure_started()
+        if not delay:
+            self._wake.set()
+        return id
+
+    # DISPATCH
+    def _ensure_started(self):
+        # the threads are started lazily and again after a fork
+        if not self.workers or self._stopping.is_set():
+            return
+        if self._dispatcher is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._dispatcher is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='task')
+                self._dispatcher = threading.Thread(target=self._dispatch, name='task-dispatcher', daemon=True)
+                self._dispatcher.start()
+
+    def _dispatch(self):
+        last_prune = 0
+        while not self._stopping.is_set():
+            # only claim what a free worker can start right away
+            if not self._slots.acquire(timeout=self.poll_interval):
+                continue
+            # cleared before looking, so an enqueue during the claim is not missed
+            self._wake.clear()
+            try:
+                job = self._claim()
+            except sqlite3.Error:
+                logger.exception('could not claim a job')
+                job = None
+            if job is None:
+                self._slots.release()
+                if time.time() - last_prune > 3600:
+                    last_prune = time.time()
+                    self._prune()
+                self._wake.wait(self.poll_interval)
+                continue
+            try:
+                self._executor.submit(self._run, job)
+            except RuntimeError:
+                # executor already shut down, the lease will hand the job back
+                self._slots.release()
+                return
+
+    def _claim(self):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT id, name, args, attempts, max_attempts FROM jobs "
+                "WHERE (status = 'queued' AND run_at <= ?) OR (status = 'running' AND locked_until < ?) "
+                "ORDER BY run_at, id LIMIT 1", (now, now)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_until = ? WHERE id = ?",
+                         (now + self.lease, row[0]))
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        id, name, args, attempts, max_attempts = row
+        return {'id': id, 'name': name, 'args': json.loads(args), 'attempts': attempts + 1, 'max_attempts': max_attempts}
+
+    def _call(self, fn, args, kwargs):
+        if self.app is None:
+            return fn(*args, **kwargs)
+        with self.app.app_context():
+            return fn(*args, **kwargs)
+
+    def _run(self, job):
+        try:
+            task = self.tasks.get(job['name'])
+            if task is None:
+                self._finish(job, 'failed', f'no task registered as {job["name"]!r}')
+                return
+            try:
+                self._call(task.fn, job['args']['args'], job['args']['kwargs'])
+            except Exception:
+                error = traceback.format_exc()
+                if job['attempts'] < job['max_attempts']:
+                    delay = min(self.backoff_max, self.backoff * 2 ** (job['attempts'] - 1))
+                    delay *= random.uniform(0.9, 1.1)
+                    logger.warning('task %s #%d failed (attempt %d of %d), retrying in %.1fs',
+                                   job['name'], job['id'], job['attempts'], job['max_attempts'], delay)
+                    self._retry(job, delay, error)
+                else:
+                    logger.error('task %s #%d failed for good after %d attempts\n%s',
+                                 job['name'], job['id'], job['attempts'], error)
+                    self._finish(job, 'failed', error)
+            else:
+                self._finish(job, 'done')
+        except sqlite3.Error:
+            # the lease runs out and the job is tried again
+            logger.exception('could not record the result of task %s #%d', job['name'], job['id'])
+        finally:
+            self._slots.release()
+
+    def _retry(self, job, delay, error):
+        with self._lock:
+            self.retried += 1
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE jobs SET status = 'queued', run_at = ?, locked_until = NULL, last_error = ? WHERE id = ?",
+                         (time.time() + delay, error, job['id']))
+        finally:
+            conn.close()
+
+    def _finish(self, job, status, error=None):
+        with self._lock:
+            if status == 'done':
+                self.completed += 1
+            else:
+                self.failed += 1
+        conn = self._connect()
+        try:
+            conn.execute('UPDATE jobs SET status = ?, locked_until = NULL, last_error = ?, finished = ? WHERE id = ?',
+                         (status, error, time.time(), job['id']))
+        finally:
+            conn.close()
+
+    def _prune(self):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?",
+                         (time.time() - self.retention,))
+        except sqlite3.Error:
+            logger.exception('could not prune finished jobs')
+        finally:
+            conn.close()
+
+    # SHUTDOWN
+    def shutdown(self, timeout=None):
+        # stop claiming new jobs and wait for the running ones
+        dispatcher, executor = getattr(self, '_dispatcher', None), getattr(self, '_executor', None)
+        if dispatcher is None or self._pid != os.getpid():
+            self._dispatcher = self._executor = None
+            return
+        self._stopping.set()
+        self._wake.set()
+        timeout = self.drain_timeout if timeout is None else timeout
+        dispatcher.join(timeout)
+        # anything still running when the timeout passes is left to its lease
+        drained = threading.Thread(target=executor.shutdown, kwargs={'wait': True}, daemon=True)
+        drained.start()
+        drained.join(timeout)
+        if drained.is_alive():
+            logger.warning('task queue shut down with jobs still running')
+        self._dispatcher = self._executor = None
+        self._stopping.clear()
+
+    def stats(self):
+        counts = {}
+        if self.path and self.workers:
+            conn = self._connect()
+            try:
+                counts = dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+            finally:
+                conn.close()
+        return {
+            'workers': self.workers,
+            'jobs': counts,
+            'completed': self.completed,
+            'failed': self.failed,
+            'retried': self.retried,
+        }